@@ -1,18 +1,43 @@
 import os
 import re
+import sys
 import hmac
 import hashlib
 import json
 import logging
 import time
+import random
+import math
 import base64
-from typing import Optional, List, Dict, Any, Tuple
+import queue
+import threading
+import uuid
+import itertools
+import heapq
+import tarfile
+import shutil
+import subprocess
+import asyncio
+import socket
+import importlib.util
+from collections import deque, OrderedDict
+from urllib.parse import urlsplit, urlunsplit
+from typing import Optional, List, Dict, Any, Tuple, Iterable, Iterator, AsyncIterator, Callable, Union
 from dataclasses import dataclass, field
 from functools import wraps
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future
 
 import requests
-import google.generativeai as genai
-from flask import Flask, request, abort, jsonify
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.connection import HTTPConnection
+from flask import Flask, Response, request, abort, jsonify
+
+try:
+    import orjson  # Optional: faster decoding of webhook payloads
+except ImportError:
+    orjson = None
 
 # --- 1. Configuration Management ---
 @dataclass
@@ -24,18 +49,61 @@ class Config:
     
     # AI and review related configurations
     AI_MODEL_NAME: str = 'gemini-2.5-pro'
+    GEMINI_API_ENDPOINT: str = ''
+    GEMINI_TRANSPORT: str = ''
     REVIEW_LABEL: str = 'ReviewedByUllrAI'
-    MAX_PROMPT_LENGTH: int = 200000
+    MAX_PROMPT_LENGTH: int = 0  # Optional character cap, 0 disables it in favour of MAX_PROMPT_TOKENS
+    MAX_PROMPT_TOKENS: int = 100000
+    CHUNKED_REVIEW: bool = True
+    MAX_REVIEW_CHUNKS: int = 8
+    AI_REVIEW_CONCURRENCY: int = 4
+    STREAM_REVIEW: bool = False
+    STREAM_UPDATE_INTERVAL: float = 5.0  # Minimum seconds between in-place updates of a streamed review comment
+    REVIEW_CACHE_MAX_ENTRIES: int = 5000
+    INCREMENTAL_REVIEW: bool = False
+    TOKEN_COUNT_CALIBRATION: bool = True
     INCLUDE_FILE_CONTEXT: bool = True
     CONTEXT_MAX_LINES: int = 400
     CONTEXT_SURROUNDING_LINES: int = 50
+    CONTEXT_SNIPPET_MAX_LINES: int = 200
+    MAX_CONTEXT_FILE_BYTES: int = 10 * 1024 * 1024
+    CONTEXT_PROVIDER: str = 'auto'
+    CONTEXT_TARBALL_THRESHOLD: int = 20
+    GRAPHQL_BATCH_SIZE: int = 50
+    GIT_MIRROR_DIR: str = ''
+    GIT_MIRROR_MAX_BYTES: int = 20 * 1024 * 1024 * 1024
+    GIT_MIRROR_FETCH_TIMEOUT: int = 600
     
     # API and network related configurations
     MAX_RETRY_ATTEMPTS: int = 3
     RETRY_DELAY: float = 2.0
+    RETRY_MAX_DELAY: float = 30.0
+    RETRY_DEADLINE: float = 120.0
     REQUEST_TIMEOUT: int = 60 # Increased timeout for file downloads
     MAX_FILES_PER_REVIEW: int = 50
+    CONTEXT_FETCH_CONCURRENCY: int = 8
+    FILE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    FILE_CACHE_DIR: str = ''
+    FILE_CACHE_DISK_MAX_BYTES: int = 512 * 1024 * 1024
+    HTTP_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    GITHUB_API_URL: str = 'https://api.github.com'
+    HTTP_POOL_CONNECTIONS: int = 10
+    HTTP_POOL_MAXSIZE: int = 32
+    HTTP_POOL_BLOCK: bool = False
+    HTTP_KEEPALIVE_SECONDS: int = 60
+    HTTP2_ENABLED: bool = False
+    GITHUB_REQUESTS_PER_SECOND: float = 10.0
+    GITHUB_REQUEST_BURST: int = 20
+    GITHUB_RATE_LIMIT_RESERVE: int = 100
+    GITHUB_RATE_LIMIT_MAX_WAIT: int = 900
     OUTPUT_LANGUAGE: str = 'english'
+
+    # Job queue related configurations
+    REVIEW_WORKERS: int = 4
+    REVIEW_QUEUE_SIZE: int = 100
+    REVIEW_DEBOUNCE_SECONDS: float = 5.0
+    ASYNC_REVIEW: bool = False
+    ASYNC_MAX_IN_FLIGHT: int = 100
     
 
     @classmethod
@@ -52,16 +120,57 @@ class Config:
             GITHUB_WEBHOOK_SECRET=os.getenv('GITHUB_WEBHOOK_SECRET', ''),
             GEMINI_API_KEY=os.getenv('GEMINI_API_KEY'),
             AI_MODEL_NAME=os.getenv('AI_MODEL_NAME', 'gemini-2.5-pro'),
+            GEMINI_API_ENDPOINT=os.getenv('GEMINI_API_ENDPOINT', ''),
+            GEMINI_TRANSPORT=os.getenv('GEMINI_TRANSPORT', ''),
             REVIEW_LABEL=os.getenv('REVIEW_LABEL', 'ReviewedByUllrAI'),
-            MAX_PROMPT_LENGTH=int(os.getenv('MAX_PROMPT_LENGTH', '200000')),
+            MAX_PROMPT_LENGTH=int(os.getenv('MAX_PROMPT_LENGTH', '0')),
+            MAX_PROMPT_TOKENS=int(os.getenv('MAX_PROMPT_TOKENS', '100000')),
+            CHUNKED_REVIEW=os.getenv('CHUNKED_REVIEW', 'true').lower() in ('true', '1', 't'),
+            MAX_REVIEW_CHUNKS=int(os.getenv('MAX_REVIEW_CHUNKS', '8')),
+            AI_REVIEW_CONCURRENCY=int(os.getenv('AI_REVIEW_CONCURRENCY', '4')),
+            STREAM_REVIEW=os.getenv('STREAM_REVIEW', 'false').lower() in ('true', '1', 't'),
+            STREAM_UPDATE_INTERVAL=float(os.getenv('STREAM_UPDATE_INTERVAL', '5.0')),
+            REVIEW_CACHE_MAX_ENTRIES=int(os.getenv('REVIEW_CACHE_MAX_ENTRIES', '5000')),
+            INCREMENTAL_REVIEW=os.getenv('INCREMENTAL_REVIEW', 'false').lower() in ('true', '1', 't'),
+            TOKEN_COUNT_CALIBRATION=os.getenv('TOKEN_COUNT_CALIBRATION', 'true').lower() in ('true', '1', 't'),
             INCLUDE_FILE_CONTEXT=os.getenv('INCLUDE_FILE_CONTEXT', 'true').lower() in ('true', '1', 't'),
             CONTEXT_MAX_LINES=int(os.getenv('CONTEXT_MAX_LINES', '400')),
             CONTEXT_SURROUNDING_LINES=int(os.getenv('CONTEXT_SURROUNDING_LINES', '50')),
+            CONTEXT_SNIPPET_MAX_LINES=int(os.getenv('CONTEXT_SNIPPET_MAX_LINES', '200')),
+            MAX_CONTEXT_FILE_BYTES=int(os.getenv('MAX_CONTEXT_FILE_BYTES', str(10 * 1024 * 1024))),
+            CONTEXT_PROVIDER=os.getenv('CONTEXT_PROVIDER', 'auto').lower(),
+            CONTEXT_TARBALL_THRESHOLD=int(os.getenv('CONTEXT_TARBALL_THRESHOLD', '20')),
+            GRAPHQL_BATCH_SIZE=int(os.getenv('GRAPHQL_BATCH_SIZE', '50')),
+            GIT_MIRROR_DIR=os.getenv('GIT_MIRROR_DIR', ''),
+            GIT_MIRROR_MAX_BYTES=int(os.getenv('GIT_MIRROR_MAX_BYTES', str(20 * 1024 * 1024 * 1024))),
+            GIT_MIRROR_FETCH_TIMEOUT=int(os.getenv('GIT_MIRROR_FETCH_TIMEOUT', '600')),
             MAX_RETRY_ATTEMPTS=int(os.getenv('MAX_RETRY_ATTEMPTS', '3')),
             RETRY_DELAY=float(os.getenv('RETRY_DELAY', '2.0')),
+            RETRY_MAX_DELAY=float(os.getenv('RETRY_MAX_DELAY', '30.0')),
+            RETRY_DEADLINE=float(os.getenv('RETRY_DEADLINE', '120.0')),
             REQUEST_TIMEOUT=int(os.getenv('REQUEST_TIMEOUT', '60')),
             MAX_FILES_PER_REVIEW=int(os.getenv('MAX_FILES_PER_REVIEW', '50')),
+            CONTEXT_FETCH_CONCURRENCY=int(os.getenv('CONTEXT_FETCH_CONCURRENCY', '8')),
+            FILE_CACHE_MAX_BYTES=int(os.getenv('FILE_CACHE_MAX_BYTES', str(64 * 1024 * 1024))),
+            FILE_CACHE_DIR=os.getenv('FILE_CACHE_DIR', ''),
+            FILE_CACHE_DISK_MAX_BYTES=int(os.getenv('FILE_CACHE_DISK_MAX_BYTES', str(512 * 1024 * 1024))),
+            HTTP_CACHE_MAX_BYTES=int(os.getenv('HTTP_CACHE_MAX_BYTES', str(32 * 1024 * 1024))),
+            GITHUB_API_URL=os.getenv('GITHUB_API_URL', 'https://api.github.com'),
+            HTTP_POOL_CONNECTIONS=int(os.getenv('HTTP_POOL_CONNECTIONS', '10')),
+            HTTP_POOL_MAXSIZE=int(os.getenv('HTTP_POOL_MAXSIZE', '32')),
+            HTTP_POOL_BLOCK=os.getenv('HTTP_POOL_BLOCK', 'false').lower() in ('true', '1', 't'),
+            HTTP_KEEPALIVE_SECONDS=int(os.getenv('HTTP_KEEPALIVE_SECONDS', '60')),
+            HTTP2_ENABLED=os.getenv('HTTP2_ENABLED', 'false').lower() in ('true', '1', 't'),
+            GITHUB_REQUESTS_PER_SECOND=float(os.getenv('GITHUB_REQUESTS_PER_SECOND', '10.0')),
+            GITHUB_REQUEST_BURST=int(os.getenv('GITHUB_REQUEST_BURST', '20')),
+            GITHUB_RATE_LIMIT_RESERVE=int(os.getenv('GITHUB_RATE_LIMIT_RESERVE', '100')),
+            GITHUB_RATE_LIMIT_MAX_WAIT=int(os.getenv('GITHUB_RATE_LIMIT_MAX_WAIT', '900')),
             OUTPUT_LANGUAGE=os.getenv('OUTPUT_LANGUAGE', 'english'),
+            REVIEW_WORKERS=int(os.getenv('REVIEW_WORKERS', '4')),
+            REVIEW_QUEUE_SIZE=int(os.getenv('REVIEW_QUEUE_SIZE', '100')),
+            REVIEW_DEBOUNCE_SECONDS=float(os.getenv('REVIEW_DEBOUNCE_SECONDS', '5.0')),
+            ASYNC_REVIEW=os.getenv('ASYNC_REVIEW', 'false').lower() in ('true', '1', 't'),
+            ASYNC_MAX_IN_FLIGHT=int(os.getenv('ASYNC_MAX_IN_FLIGHT', '100')),
         )
 
 # --- 2. Logging Configuration ---
@@ -77,23 +186,222 @@ def setup_logging():
     return logging.getLogger(__name__)
 
 # --- 3. Error Handling and Retry Decorator ---
-def retry_on_failure(max_attempts: int = 3, delay: float = 1.0):
-    """Retry decorator with enhanced failure logging"""
+class FileSkippedError(ValueError):
+    """Raised when a file is deliberately not fetched (binary or too large); never retried"""
+
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+FATAL_EXCEPTION_TYPES = (ValueError, TypeError, KeyError)
+
+def _get_gemini_fatal_exception_types() -> Tuple[type, ...]:
+    """Gemini SDK errors that are never retried; the SDK is imported lazily, so they can only occur once it is loaded"""
+    generation_types = sys.modules.get("google.generativeai.types.generation_types")
+    if generation_types is None:
+        return ()
+    return (generation_types.BlockedPromptException, generation_types.StopCandidateException)
+
+def _get_error_status_code(error: Exception) -> Optional[int]:
+    """Extract an HTTP status code from requests or Google API errors"""
+    response = getattr(error, 'response', None)
+    if response is not None and getattr(response, 'status_code', None) is not None:
+        return response.status_code
+    google_exceptions = sys.modules.get("google.api_core.exceptions")
+    if google_exceptions and isinstance(error, google_exceptions.GoogleAPICallError) and error.code is not None:
+        return int(error.code)
+    return None
+
+def is_retryable_error(error: Exception) -> bool:
+    """Classify an error as transient (worth retrying) or fatal"""
+    status_code = _get_error_status_code(error)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(error, FATAL_EXCEPTION_TYPES + _get_gemini_fatal_exception_types()):
+        return False
+    return True
+
+class RetryStats:
+    """Thread-safe per-function retry counters"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(self, func_name: str, **increments: float) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(func_name, {"calls": 0, "retries": 0, "fatal": 0, "exhausted": 0, "sleep_seconds": 0.0})
+            for name, value in increments.items():
+                stats[name] += value
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+retry_stats = RetryStats()
+
+class MetricsRegistry:
+    """
+    Minimal in-process metrics registry rendered in the Prometheus text exposition format.
+    Holds latency histograms and counters; gauges and values kept elsewhere (e.g. retry_stats) are read
+    through callbacks at scrape time. Metrics are per process, so scrape every worker process.
+    """
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._meta: Dict[str, Tuple[str, str]] = {}  # name -> (type, help)
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], List[float]] = {}  # bucket counts + sum + count
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._callbacks: Dict[str, Callable[[], List[Tuple[Dict[str, str], float]]]] = {}
+
+    def describe(self, name: str, metric_type: str, help_text: str,
+                 callback: Optional[Callable[[], List[Tuple[Dict[str, str], float]]]] = None) -> None:
+        """Declare a metric; a callback returns (labels, value) samples when the metric is read at scrape time"""
+        self._meta[name] = (metric_type, help_text)
+        if callback:
+            self._callbacks[name] = callback
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def inc(self, name: str, amount: float = 1.0, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    @contextmanager
+    def time(self, name: str, **labels: str) -> Iterator[None]:
+        """Observe the duration of the with-block, whether it succeeds or raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+        def escape(value: Any) -> str:
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        pairs = [f'{key}="{escape(value)}"' for key, value in labels]
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text format (version 0.0.4)"""
+        with self._lock:
+            histograms = {key: list(series) for key, series in self._histograms.items()}
+            counters = dict(self._counters)
+        lines: List[str] = []
+        for name, (metric_type, help_text) in sorted(self._meta.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            if metric_type == 'histogram':
+                for (series_name, labels), series in sorted(histograms.items()):
+                    if series_name != name:
+                        continue
+                    for bound, count in zip(self.buckets, series):
+                        lines.append(f"{name}_bucket{self._format_labels(labels + (('le', repr(float(bound))),))} {count:g}")
+                    lines.append(f"{name}_bucket{self._format_labels(labels + (('le', '+Inf'),))} {series[-1]:g}")
+                    lines.append(f"{name}_sum{self._format_labels(labels)} {series[-2]!r}")
+                    lines.append(f"{name}_count{self._format_labels(labels)} {series[-1]:g}")
+            else:
+                samples = [(labels, value) for (series_name, labels), value in sorted(counters.items()) if series_name == name]
+                if name in self._callbacks:
+                    try:
+                        samples += [(tuple(sorted(labels.items())), value) for labels, value in self._callbacks[name]()]
+                    except Exception as e:
+                        logger.warning(f"Failed to collect metric '{name}': {e}")
+                for labels, value in samples:
+                    lines.append(f"{name}{self._format_labels(labels)} {float(value)!r}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+STAGE_METRIC = "pr_reviewer_stage_duration_seconds"
+metrics.describe(STAGE_METRIC, "histogram", "Latency of review pipeline stages in seconds")
+metrics.describe("pr_reviewer_webhook_events_total", "counter", "Webhook deliveries by event type and outcome")
+metrics.describe("pr_reviewer_reviews_total", "counter", "Finished reviews by result status")
+metrics.describe("pr_reviewer_context_skipped_files_total", "counter", "Files whose context was not included, by reason")
+metrics.describe("pr_reviewer_stream_interruptions_total", "counter", "Streamed AI reviews that ended early and were posted partially")
+for _retry_field, _retry_help in (("calls", "Calls of retried functions"), ("retries", "Retries of transient failures"),
+                                  ("fatal", "Non-retryable failures"), ("exhausted", "Calls that failed after all retries")):
+    metrics.describe(f"pr_reviewer_retry_{_retry_field}_total", "counter", f"{_retry_help}, by function",
+                     lambda field=_retry_field: [({"function": name}, stats[field]) for name, stats in retry_stats.snapshot().items()])
+
+def _get_retry_sleep(func: Callable, error: Exception, attempt: int, start_time: float, max_attempts: int,
+                     delay: float, max_delay: float, deadline: Optional[float]) -> Optional[float]:
+    """Record a failed attempt and return how long to sleep before the next one, or None to give up"""
+    func_name = func.__qualname__
+    if not is_retryable_error(error):
+        retry_stats.record(func_name, fatal=1)
+        logger.error(f"Function {func.__name__} failed with non-retryable error: {error}")
+        return None
+    sleep_seconds = random.uniform(0, min(max_delay, delay * (2 ** attempt)))
+    elapsed = time.monotonic() - start_time
+    if attempt >= max_attempts - 1 or (deadline is not None and elapsed + sleep_seconds > deadline):
+        retry_stats.record(func_name, exhausted=1)
+        logger.error(f"Function {func.__name__} failed after {attempt + 1} attempts in {elapsed:.1f} seconds.")
+        return None
+    retry_stats.record(func_name, retries=1, sleep_seconds=sleep_seconds)
+    logger.warning(f"Function {func.__name__} failed (attempt {attempt + 1}/{max_attempts}): {error}. Retrying in {sleep_seconds:.1f} seconds...")
+    return sleep_seconds
+
+def _resolve_retry_policy(max_attempts: Optional[int], delay: Optional[float], max_delay: Optional[float],
+                          deadline: Optional[float]) -> Tuple[int, float, float, Optional[float]]:
+    """Fill in unset retry settings from the config when the decorated function is called, not when it is decorated"""
+    return (config.MAX_RETRY_ATTEMPTS if max_attempts is None else max_attempts,
+            config.RETRY_DELAY if delay is None else delay,
+            config.RETRY_MAX_DELAY if max_delay is None else max_delay,
+            config.RETRY_DEADLINE if deadline is None else deadline)
+
+def retry_on_failure(max_attempts: Optional[int] = None, delay: Optional[float] = None, max_delay: Optional[float] = None,
+                     deadline: Optional[float] = None):
+    """
+    Retry decorator for transient failures.
+    Fatal errors (e.g. 404, 422, safety blocks) are raised immediately; transient ones are retried with
+    exponential backoff and full jitter until the attempts or the total deadline (seconds) run out.
+    Settings that are not given default to MAX_RETRY_ATTEMPTS, RETRY_DELAY, RETRY_MAX_DELAY and RETRY_DEADLINE.
+    """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            last_exception = None
-            for attempt in range(max_attempts):
+            start_time = time.monotonic()
+            retry_stats.record(func.__qualname__, calls=1)
+            policy = _resolve_retry_policy(max_attempts, delay, max_delay, deadline)
+            for attempt in range(policy[0]):
                 try:
                     return func(*args, **kwargs)
                 except Exception as e:
-                    last_exception = e
-                    if attempt < max_attempts - 1:
-                        logger.warning(f"Function {func.__name__} failed (attempt {attempt + 1}/{max_attempts}): {e}. Retrying in {delay * (attempt + 1):.1f} seconds...")
-                        time.sleep(delay * (attempt + 1))
-                    else:
-                        logger.error(f"Function {func.__name__} failed after {max_attempts} attempts.")
-            raise last_exception
+                    sleep_seconds = _get_retry_sleep(func, e, attempt, start_time, *policy)
+                    if sleep_seconds is None:
+                        raise
+                    time.sleep(sleep_seconds)
+        return wrapper
+    return decorator
+
+def async_retry_on_failure(max_attempts: Optional[int] = None, delay: Optional[float] = None, max_delay: Optional[float] = None,
+                           deadline: Optional[float] = None):
+    """Coroutine counterpart of retry_on_failure; backoff sleeps yield to the event loop"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            start_time = time.monotonic()
+            retry_stats.record(func.__qualname__, calls=1)
+            policy = _resolve_retry_policy(max_attempts, delay, max_delay, deadline)
+            for attempt in range(policy[0]):
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    sleep_seconds = _get_retry_sleep(func, e, attempt, start_time, *policy)
+                    if sleep_seconds is None:
+                        raise
+                    await asyncio.sleep(sleep_seconds)
         return wrapper
     return decorator
 
@@ -102,177 +410,1739 @@ logger = setup_logging()
 config = Config.from_env()
 app = Flask(__name__)
 
-genai.configure(api_key=config.GEMINI_API_KEY)
-ai_model = genai.GenerativeModel(config.AI_MODEL_NAME)
+class ProcessLocal:
+    """
+    Lazily created per-process object: the factory runs on first use in each process, not at import time.
+    Forked workers (e.g. gunicorn --preload) therefore never share HTTP sessions, gRPC channels or locks with the
+    master. Attribute access is forwarded to the object; a factory may return None for a disabled component.
+    """
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._instance: Any = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self) -> None:
+        self._lock = threading.Lock()
+
+    def instance(self) -> Any:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._instance = self._factory()
+                    self._pid = os.getpid()
+        return self._instance
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.instance(), name)
+
+    def __bool__(self) -> bool:
+        return self.instance() is not None
+
+def _create_ai_model() -> Any:
+    """Import and configure the Gemini SDK; it is by far the slowest import and is not needed to accept webhooks"""
+    import google.generativeai as genai
+    # GEMINI_API_ENDPOINT/GEMINI_TRANSPORT point the client at a proxy or a local stand-in (e.g. "rest" + "http://127.0.0.1:8081")
+    genai.configure(api_key=config.GEMINI_API_KEY, transport=config.GEMINI_TRANSPORT or None,
+                    client_options={"api_endpoint": config.GEMINI_API_ENDPOINT} if config.GEMINI_API_ENDPOINT else None)
+    return genai.GenerativeModel(config.AI_MODEL_NAME)
+
+ai_model = ProcessLocal(_create_ai_model)
+
+class TokenEstimator:
+    """
+    Local token estimator calibrated against the model's count_tokens.
+    CJK characters are counted roughly one token each; other text uses a chars-per-token ratio that is
+    refined from real counts. Per-text character counts are cached, so repeated files are not rescanned.
+    """
+    DEFAULT_TOKEN_LIMIT = 128000
+    CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+    CJK_TOKENS_PER_CHAR = 1.0
+
+    def __init__(self, chars_per_token: float = 3.5, cache_size: int = 4096):
+        self.chars_per_token = chars_per_token
+        self.cache_size = cache_size
+        self._counts: "OrderedDict[bytes, Tuple[int, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _char_counts(self, text: str) -> Tuple[int, int]:
+        """Return (cjk_chars, other_chars) for text"""
+        key = hashlib.blake2b(text.encode('utf-8', errors='surrogatepass'), digest_size=16).digest()
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is not None:
+                self._counts.move_to_end(key)
+                return counts
+        cjk_chars = sum(1 for _ in self.CJK_PATTERN.finditer(text))
+        counts = (cjk_chars, len(text) - cjk_chars)
+        with self._lock:
+            self._counts[key] = counts
+            if len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+        return counts
+
+    def estimate(self, text: str) -> int:
+        cjk_chars, other_chars = self._char_counts(text)
+        return math.ceil(cjk_chars * self.CJK_TOKENS_PER_CHAR + other_chars / self.chars_per_token)
+
+    def calibrate(self, text: str, actual_tokens: int) -> None:
+        """Move the chars-per-token ratio towards what the model's tokenizer reported for text"""
+        cjk_chars, other_chars = self._char_counts(text)
+        other_tokens = actual_tokens - cjk_chars * self.CJK_TOKENS_PER_CHAR
+        if other_chars < 1000 or other_tokens <= 0:
+            return
+        observed = min(8.0, max(1.5, other_chars / other_tokens))
+        with self._lock:
+            self.chars_per_token = 0.7 * self.chars_per_token + 0.3 * observed
+
+token_estimator = TokenEstimator()
+_model_input_token_limit: Optional[int] = None
+
+# Input token limits of common models, so the limit is usually known without an API round trip
+KNOWN_MODEL_INPUT_TOKEN_LIMITS = {
+    'gemini-2.5-pro': 1048576,
+    'gemini-2.5-flash': 1048576,
+    'gemini-2.0-flash': 1048576,
+    'gemini-1.5-pro': 2097152,
+    'gemini-1.5-flash': 1048576,
+}
+MODEL_METADATA_TIMEOUT = 10  # Seconds; token counting and model lookups must stay cheap
+
+def get_model_input_token_limit() -> Optional[int]:
+    """Look up (once) the input token limit of the configured model"""
+    global _model_input_token_limit
+    if _model_input_token_limit is None:
+        known_limit = KNOWN_MODEL_INPUT_TOKEN_LIMITS.get(config.AI_MODEL_NAME.split('/', 1)[-1])
+        try:
+            if not known_limit:
+                model_name = ai_model.model_name
+                from google.generativeai import client as genai_client
+                known_limit = genai_client.get_default_model_client().get_model(
+                    name=model_name, retry=None, timeout=MODEL_METADATA_TIMEOUT).input_token_limit
+            _model_input_token_limit = known_limit
+        except Exception as e:
+            logger.warning(f"Unable to get input token limit for model '{config.AI_MODEL_NAME}': {e}")
+            _model_input_token_limit = 0
+    return _model_input_token_limit or None
+
+def count_model_tokens(text: str) -> int:
+    """Count tokens of text with the configured model's tokenizer"""
+    model_name = ai_model.model_name  # Loads and configures the Gemini SDK on first use
+    from google.ai import generativelanguage as glm
+    from google.generativeai import client as genai_client
+    count_request = glm.CountTokensRequest(model=model_name,
+                                           contents=[glm.Content(parts=[glm.Part(text=text)])])
+    return genai_client.get_default_generative_client().count_tokens(
+        count_request, retry=None, timeout=MODEL_METADATA_TIMEOUT).total_tokens
+
+class FileContentCache:
+    """
+    LRU cache of decoded file contents with size-based eviction and an optional on-disk tier.
+    Keys are git blob SHAs when known (content-addressed), otherwise (repo, path, ref).
+    """
+    def __init__(self, max_bytes: int, disk_dir: str = '', disk_max_bytes: int = 0):
+        self.max_bytes = max(0, max_bytes)
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = max(0, disk_max_bytes)
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "disk_hits": 0, "evictions": 0}
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(owner: str, repo: str, file_path: str, ref: str, blob_sha: Optional[str] = None) -> str:
+        if blob_sha:
+            return f"blob:{blob_sha}"
+        return f"ref:{owner}/{repo}@{ref}:{file_path}"
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            content = self._entries.get(key)
+            if content is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return content
+        content = self._disk_get(key)
+        with self._lock:
+            if content is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["hits"] += 1
+            self.stats["disk_hits"] += 1
+        self._memory_put(key, content)
+        return content
+
+    def contains(self, key: str) -> bool:
+        """Whether key is cached in either tier, without counting a hit or miss or refreshing its LRU position"""
+        with self._lock:
+            if key in self._entries:
+                return True
+        return bool(self.disk_dir) and os.path.exists(self._disk_path(key))
+
+    def put(self, key: str, content: str) -> None:
+        self._memory_put(key, content)
+        self._disk_put(key, content)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return counters and current memory usage"""
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries), "bytes": self._total_bytes}
+
+    def _memory_put(self, key: str, content: str) -> None:
+        size = len(content.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._sizes[key]
+            self._entries[key] = content
+            self._entries.move_to_end(key)
+            self._sizes[key] = size
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                old_key, _ = self._entries.popitem(last=False)
+                self._total_bytes -= self._sizes.pop(old_key)
+                self.stats["evictions"] += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            os.utime(path)  # Refresh mtime so disk eviction stays LRU
+            return content
+        except OSError:
+            return None
+
+    def _disk_put(self, key: str, content: str) -> None:
+        if not self.disk_dir or self.disk_max_bytes <= 0:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+            self._disk_evict()
+        except OSError as e:
+            logger.warning(f"Failed to write file cache entry to disk: {e}")
+
+    def _disk_evict(self) -> None:
+        """Remove least recently used disk entries until the tier fits its size budget"""
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter with TCP keep-alive probes on pooled connections and connection pool statistics.
+    Probes keep idle connections from being silently dropped by NATs and load balancers, so they stay reusable.
+    """
+    __attrs__ = HTTPAdapter.__attrs__ + ['keepalive_seconds']
+
+    def __init__(self, keepalive_seconds: int = 60, **kwargs: Any):
+        self.keepalive_seconds = keepalive_seconds
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections: int, maxsize: int, block: bool = False, **pool_kwargs: Any) -> None:
+        if self.keepalive_seconds > 0:
+            socket_options = list(HTTPConnection.default_socket_options) + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+            if hasattr(socket, 'TCP_KEEPIDLE'):  # Linux; other platforms keep the system probe timings
+                socket_options += [(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self.keepalive_seconds),
+                                   (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, max(1, self.keepalive_seconds // 6)),
+                                   (socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)]
+            pool_kwargs['socket_options'] = socket_options
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+
+    def pool_stats(self) -> List[Dict[str, Any]]:
+        """Per-host pool usage: connections checked out, idle connections, and how often connections were reused"""
+        stats = []
+        pools = self.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None or pool.pool is None:
+                continue
+            # Free slots hold either an idle connection or None (not opened yet); the rest are checked out
+            slots = pool.pool
+            available = slots.qsize()
+            idle = sum(1 for conn in list(slots.queue) if conn is not None)
+            stats.append({"host": pool.host, "maxsize": slots.maxsize, "in_use": slots.maxsize - available, "idle": idle,
+                          "connections_opened": pool.num_connections, "requests": pool.num_requests,
+                          "reused_requests": max(0, pool.num_requests - pool.num_connections)})
+        return stats
+
+class ConditionalRequestAdapter(PooledHTTPAdapter):
+    """
+    Transport adapter that stores ETags and bodies of GET responses and revalidates them with If-None-Match.
+    A 304 is served from the stored copy; GitHub does not count 304s against the primary rate limit.
+    """
+    def __init__(self, max_bytes: int, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.max_bytes = max(0, max_bytes)
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"revalidated": 0, "stored": 0, "evictions": 0}
+
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+        if request.method != 'GET' or self.max_bytes <= 0 or 'If-None-Match' in request.headers:
+            return super().send(request, **kwargs)
+
+        # The Accept header selects the representation, so it is part of the key
+        cache_key = f"{request.headers.get('Accept', '')} {request.url}"
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+        if entry is not None:
+            request.headers['If-None-Match'] = entry['etag']
+
+        response = super().send(request, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            with self._lock:
+                self.stats["revalidated"] += 1
+            return self._build_cached_response(request, response, entry)
+        if response.status_code == 200 and response.headers.get('ETag') and not kwargs.get('stream'):
+            self._store(cache_key, response)
+        return response
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return counters and current memory usage"""
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries), "bytes": self._total_bytes}
+
+    def _store(self, cache_key: str, response: requests.Response) -> None:
+        content = response.content
+        if len(content) > self.max_bytes:
+            return
+        entry = {"etag": response.headers['ETag'], "headers": dict(response.headers),
+                 "content": content, "encoding": response.encoding}
+        with self._lock:
+            old_entry = self._entries.pop(cache_key, None)
+            if old_entry is not None:
+                self._total_bytes -= len(old_entry['content'])
+            self._entries[cache_key] = entry
+            self._total_bytes += len(content)
+            self.stats["stored"] += 1
+            while self._total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted['content'])
+                self.stats["evictions"] += 1
+
+    @staticmethod
+    def _build_cached_response(request: requests.PreparedRequest, not_modified: requests.Response,
+                               entry: Dict[str, Any]) -> requests.Response:
+        """Rebuild a 200 response from the stored copy, keeping the fresh headers (e.g. rate limits) of the 304"""
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.headers.update({name: value for name, value in not_modified.headers.items()
+                                 if name.lower() not in ('content-length', 'content-encoding', 'transfer-encoding')})
+        response._content = entry['content']
+        response.encoding = entry['encoding']
+        response.url = request.url
+        response.request = request
+        response.elapsed = not_modified.elapsed
+        response.connection = not_modified.connection
+        not_modified.close()
+        return response
+
+class GitHubRateLimiter:
+    """
+    Shared token-bucket scheduler for GitHub API requests.
+    Paces requests from the X-RateLimit-Remaining/Reset headers and parks callers until the
+    reset time (or Retry-After) instead of letting them burn retries against a rate-limited API.
+    GitHub keeps a separate quota per X-RateLimit-Resource (REST 'core', 'graphql', ...), so pacing and pauses
+    derived from those headers apply to that resource only; a Retry-After (secondary rate limit) pauses all of them.
+    """
+    DEFAULT_RESOURCE = "core"
+
+    def __init__(self, requests_per_second: float, burst: int, reserve: int, max_wait: float):
+        self.base_rate = max(0.01, requests_per_second)
+        self.burst = max(1, burst)
+        self.reserve = max(0, reserve)
+        self.max_wait = max_wait
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0  # Secondary rate limit, applies to every resource
+        self._resources: Dict[str, Dict[str, Any]] = {}  # Per resource: paused_until, paced_rate, paced_until
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {"waits": 0, "wait_seconds": 0.0, "pauses": 0, "remaining": None}
+        self.remaining_by_resource: Dict[str, int] = {}
+
+    def _resource_state(self, resource: str) -> Dict[str, Any]:
+        return self._resources.setdefault(resource, {"paused_until": 0.0, "paced_rate": None, "paced_until": 0.0})
+
+    def acquire(self, resource: str = DEFAULT_RESOURCE) -> None:
+        """Block until a request to the given rate limit resource may be sent"""
+        waited = 0.0
+        while True:
+            wait = self._try_acquire(waited, resource)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self, resource: str = DEFAULT_RESOURCE) -> None:
+        """Wait without blocking the event loop until a request to the given resource may be sent"""
+        waited = 0.0
+        while True:
+            wait = self._try_acquire(waited, resource)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def _try_acquire(self, waited: float, resource: str) -> float:
+        """Take a token and return 0, or return how long to wait before trying again"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._resource_state(resource)
+            wait = max(self._paused_until, state["paused_until"]) - now
+            if wait <= 0:
+                rate = self._current_rate(now, state)
+                self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * rate)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    if waited:
+                        self.stats["waits"] += 1
+                        self.stats["wait_seconds"] += waited
+                    return 0.0
+                wait = (1 - self._tokens) / rate
+            return wait
+
+    def seconds_until_available(self, response: requests.Response) -> Optional[float]:
+        """If the response says we are rate limited, return how long to park before retrying"""
+        if response.status_code not in (403, 429):
+            return None
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is not None:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                return None
+        if response.headers.get('X-RateLimit-Remaining') == '0':
+            reset = self._parse_int(response.headers.get('X-RateLimit-Reset'))
+            if reset is not None:
+                return max(0.0, reset - time.time())
+        return None
+
+    def update(self, response: requests.Response, resource: str = DEFAULT_RESOURCE) -> None:
+        """Adjust pacing of the response's rate limit resource from its headers"""
+        headers = response.headers
+        resource = headers.get('X-RateLimit-Resource') or resource
+        remaining = self._parse_int(headers.get('X-RateLimit-Remaining'))
+        reset = self._parse_int(headers.get('X-RateLimit-Reset'))
+        park_seconds = self.seconds_until_available(response)
+        with self._lock:
+            now = time.monotonic()
+            state = self._resource_state(resource)
+            if remaining is not None:
+                self.remaining_by_resource[resource] = remaining
+                if resource == self.DEFAULT_RESOURCE:
+                    self.stats["remaining"] = remaining
+            if park_seconds is not None:
+                if headers.get('Retry-After') is not None:
+                    self._paused_until = max(self._paused_until, now + park_seconds)
+                else:
+                    state["paused_until"] = max(state["paused_until"], now + park_seconds)
+                self.stats["pauses"] += 1
+                logger.warning(f"GitHub rate limit hit ({resource}), pausing GitHub requests for {park_seconds:.1f} seconds.")
+            elif remaining is not None and reset is not None and remaining <= self.reserve:
+                # Spread the remaining budget evenly over the time left until the window resets
+                seconds_to_reset = max(1.0, reset - time.time())
+                if remaining == 0:
+                    state["paused_until"] = max(state["paused_until"], now + seconds_to_reset)
+                    self.stats["pauses"] += 1
+                else:
+                    state["paced_rate"] = remaining / seconds_to_reset
+                    state["paced_until"] = now + seconds_to_reset
+            elif remaining is not None:
+                state["paced_rate"] = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            paused_until = max([self._paused_until] + [state["paused_until"] for state in self._resources.values()])
+            return {**self.stats, "remaining_by_resource": dict(self.remaining_by_resource),
+                    "paused_for": max(0.0, round(paused_until - now, 1))}
+
+    def _current_rate(self, now: float, state: Dict[str, Any]) -> float:
+        if state["paced_rate"] is not None and now < state["paced_until"]:
+            return max(0.001, min(self.base_rate, state["paced_rate"]))
+        return self.base_rate
+
+    @staticmethod
+    def _parse_int(value: Optional[str]) -> Optional[int]:
+        try:
+            return int(value) if value is not None else None
+        except ValueError:
+            return None
+
+# Selected lines of a file: (kept lines by 1-based line number, number of lines read, whether the end of the file was reached)
+FileLines = Tuple[Dict[int, str], int, bool]
+
+def github_graphql_url(api_url: str) -> str:
+    """GraphQL endpoint for a REST API base URL; GitHub Enterprise Server serves it at /api/graphql, not /api/v3/graphql"""
+    api_url = api_url.rstrip('/')
+    if api_url.endswith('/api/v3'):
+        return f"{api_url[:-len('/v3')]}/graphql"
+    return f"{api_url}/graphql"
+
+def github_web_url(api_url: str) -> str:
+    """
+    Web (and git) base URL for a REST API base URL: https://api.github.com maps to https://github.com and
+    https://github.example.com/api/v3 to https://github.example.com.
+    """
+    parts = urlsplit(api_url.rstrip('/'))
+    if parts.path.endswith('/api/v3'):
+        return urlunsplit((parts.scheme, parts.netloc, parts.path[:-len('/api/v3')], '', ''))
+    host = parts.netloc[len('api.'):] if parts.netloc.startswith('api.') else parts.netloc
+    return urlunsplit((parts.scheme, host, parts.path, '', ''))
 
 class GitHubClient:
     """Encapsulates GitHub API operations with logging for each operation"""
-    def __init__(self, token: str, timeout: int):
+    PER_PAGE = 100  # Maximum page size supported by GitHub list endpoints
+    RATE_LIMIT_MAX_PARKS = 3
+    STREAM_CHUNK_SIZE = 64 * 1024
+    BINARY_SNIFF_BYTES = 8000  # Same heuristic as git: a NUL byte near the start means binary
+
+    def __init__(self, token: str, timeout: int, content_cache: Optional[FileContentCache] = None,
+                 http_cache_max_bytes: int = 0, rate_limiter: Optional[GitHubRateLimiter] = None,
+                 max_file_bytes: int = 10 * 1024 * 1024, graphql_batch_size: int = 50,
+                 pool_options: Optional[Dict[str, Any]] = None, api_url: str = "https://api.github.com"):
         self.session = requests.Session()
+        self.api_url = api_url.rstrip('/')
+        self.graphql_url = github_graphql_url(self.api_url)
+        self.max_file_bytes = max_file_bytes
+        self.graphql_batch_size = max(1, graphql_batch_size)
+        self.rate_limiter = rate_limiter
+        # pool_options: pool_connections, pool_maxsize, pool_block and keepalive_seconds for every mounted adapter
+        pool_options = pool_options or {}
+        self.session.mount("https://", PooledHTTPAdapter(**pool_options))
+        self.session.mount("http://", PooledHTTPAdapter(**pool_options))
+        self.http_cache: Optional[ConditionalRequestAdapter] = None
+        if http_cache_max_bytes > 0:
+            self.http_cache = ConditionalRequestAdapter(http_cache_max_bytes, **pool_options)
+            self.session.mount(f"{self.api_url}/", self.http_cache)
         self.session.headers.update({
             "Authorization": f"token {token}",
             "Accept": "application/vnd.github.v3+json",
             "X-GitHub-Api-Version": "2022-11-28" # Recommended to add API version header
         })
         self.timeout = timeout
+        self.content_cache = content_cache
+
+    def pool_stats(self) -> List[Dict[str, Any]]:
+        """Connection pool statistics of all adapters mounted on the session"""
+        adapters = {id(adapter): adapter for adapter in self.session.adapters.values()}
+        return [stats for adapter in adapters.values() if isinstance(adapter, PooledHTTPAdapter)
+                for stats in adapter.pool_stats()]
+
+    def _request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """Send a request through the shared rate limiter, parking until the limit resets when throttled"""
+        kwargs.setdefault('timeout', self.timeout)
+        if self.rate_limiter is None:
+            return self.session.request(method, url, **kwargs)
+
+        # GraphQL has its own quota; its responses must not pace or pause REST calls
+        resource = "graphql" if url == self.graphql_url else GitHubRateLimiter.DEFAULT_RESOURCE
+        for _ in range(self.RATE_LIMIT_MAX_PARKS + 1):
+            self.rate_limiter.acquire(resource)
+            response = self.session.request(method, url, **kwargs)
+            self.rate_limiter.update(response, resource)
+            park_seconds = self.rate_limiter.seconds_until_available(response)
+            if park_seconds is None or park_seconds > self.rate_limiter.max_wait:
+                return response
+            response.close()
+        return response
 
-    @retry_on_failure(max_attempts=config.MAX_RETRY_ATTEMPTS)
+    @retry_on_failure()
     def get_pr_details(self, owner: str, repo: str, pr_number: int) -> Dict[str, Any]:
         """Get detailed information for a single PR"""
         logger.info(f"[GitHub API] ==> 'get_pr_details' for PR #{pr_number}")
-        url = f"https://api.github.com/repos/{owner}/{repo}/pulls/{pr_number}"
-        response = self.session.get(url, timeout=self.timeout)
+        url = f"{self.api_url}/repos/{owner}/{repo}/pulls/{pr_number}"
+        response = self._request('GET', url)
         response.raise_for_status()
         return response.json()
 
-    @retry_on_failure(max_attempts=config.MAX_RETRY_ATTEMPTS)
-    def get_pr_files(self, owner: str, repo: str, pr_number: int) -> List[Dict[str, Any]]:
-        """Get PR file changes"""
-        logger.info(f"[GitHub API] ==> 'get_pr_files' for PR #{pr_number}")
-        url = f"https://api.github.com/repos/{owner}/{repo}/pulls/{pr_number}/files"
-        response = self.session.get(url, timeout=self.timeout)
+    @retry_on_failure()
+    def _get_page(self, url: str, params: Optional[Dict[str, Any]] = None) -> Tuple[Any, Optional[str]]:
+        """Get one page of a paginated endpoint, returning its JSON body and the 'next' URL from the Link header"""
+        response = self._request('GET', url, params=params)
         response.raise_for_status()
-        files = response.json()
-        logger.info(f"  Output: Successfully retrieved {len(files)} file changes.")
-        return files
+        return response.json(), response.links.get('next', {}).get('url')
 
-    @retry_on_failure(max_attempts=config.MAX_RETRY_ATTEMPTS)
-    def get_file_content_from_repo(self, owner: str, repo: str, file_path: str, ref: str) -> str:
+    def iter_pr_files(self, owner: str, repo: str, pr_number: int) -> Iterator[Dict[str, Any]]:
+        """Lazily yield PR file changes, fetching further pages only when the caller asks for them"""
+        logger.info(f"[GitHub API] ==> 'iter_pr_files' for PR #{pr_number}")
+        url: Optional[str] = f"{self.api_url}/repos/{owner}/{repo}/pulls/{pr_number}/files"
+        params: Optional[Dict[str, Any]] = {"per_page": self.PER_PAGE}
+        page = 0
+        while url:
+            with metrics.time(STAGE_METRIC, stage="get_pr_files"):
+                files, url = self._get_page(url, params)
+            params = None  # The 'next' URL already carries the query string
+            page += 1
+            logger.info(f"  Output: Retrieved page {page} with {len(files)} file changes.")
+            yield from files
+
+    def compare_commits(self, owner: str, repo: str, base: str, head: str) -> Tuple[str, Iterator[Dict[str, Any]]]:
         """
-        Use Contents API to get file content from repository at specific version.
-        This method is more reliable than directly concatenating raw URLs.
+        Compare two commits. Returns the comparison status ('ahead', 'behind', 'diverged' or 'identical')
+        and a lazy iterator over the changed files; pages after the first are fetched only when iterated.
         """
-        logger.info(f"[GitHub API] ==> 'get_file_content_from_repo'")
-        logger.info(f"  Input: owner={owner}, repo={repo}, path={file_path}, ref={ref}")
-        
-        # Use official Contents API endpoint
-        url = f"https://api.github.com/repos/{owner}/{repo}/contents/{file_path}"
-        params = {"ref": ref}
-        
-        # All requests through self.session automatically carry authentication headers
-        response = self.session.get(url, params=params, timeout=self.timeout)
-        response.raise_for_status()
-        data = response.json()
+        logger.info(f"[GitHub API] ==> 'compare_commits' {base[:7]}...{head[:7]}")
+        url = f"{self.api_url}/repos/{owner}/{repo}/compare/{base}...{head}"
+        comparison, next_url = self._get_page(url, {"per_page": self.PER_PAGE})
+        status = comparison.get('status', 'unknown')
+        first_files = comparison.get('files', [])
+        logger.info(f"  Output: Comparison status '{status}', {comparison.get('total_commits', 0)} commits, {len(first_files)} files on first page.")
 
-        if 'content' not in data:
-            raise ValueError(f"'content' field not found for file '{file_path}' in API response.")
+        def iter_files() -> Iterator[Dict[str, Any]]:
+            yield from first_files
+            page_url = next_url
+            while page_url:
+                page, page_url = self._get_page(page_url)
+                yield from page.get('files', [])
 
-        # Content is Base64 encoded and needs to be decoded
-        content_b64 = data['content']
-        content_bytes = base64.b64decode(content_b64)
-        
+        return status, iter_files()
+
+    def get_file_lines_from_repo(self, owner: str, repo: str, file_path: str, ref: str,
+                                 line_filter: Callable[[int], bool], last_line: int,
+                                 blob_sha: Optional[str] = None,
+                                 prefetched_content: Optional[str] = None) -> Tuple[Dict[int, str], int, bool]:
+        """
+        Get selected lines of a file at a specific version without holding the whole file in memory.
+        Served from prefetched_content or the content cache when possible; otherwise the raw content is streamed
+        and reading stops after last_line.
+        Returns (kept lines by 1-based line number, number of lines read, whether the end of the file was reached).
+        """
+        cache_key = FileContentCache.make_key(owner, repo, file_path, ref, blob_sha)
+        cached_content = prefetched_content
+        if cached_content is None and self.content_cache:
+            cached_content = self.content_cache.get(cache_key)
+        if cached_content is not None:
+            logger.info(f"[GitHub API] ==> 'get_file_lines_from_repo' cache hit for '{file_path}'")
+            return self._select_lines(cached_content, line_filter, last_line)
+
+        with metrics.time(STAGE_METRIC, stage="context_fetch"):
+            kept, lines_read, complete = self._stream_file_lines(owner, repo, file_path, ref, line_filter, last_line)
+        if complete and self.content_cache and len(kept) == lines_read:
+            # The whole file was read, so it can serve later full-content lookups too
+            self.content_cache.put(cache_key, "\n".join(kept[number] for number in range(1, lines_read + 1)))
+        return kept, lines_read, complete
+
+    @staticmethod
+    def _select_lines(content: str, line_filter: Callable[[int], bool], last_line: int) -> FileLines:
+        """Pick the lines accepted by line_filter up to last_line from content that is already in memory"""
+        lines = content.splitlines()
+        lines_read = min(len(lines), last_line)
+        kept = {number: lines[number - 1] for number in range(1, lines_read + 1) if line_filter(number)}
+        return kept, lines_read, len(lines) <= last_line
+
+    @staticmethod
+    def _decode_line(raw_line: bytes) -> str:
+        raw_line = raw_line.rstrip(b"\r")
         try:
-            # Try UTF-8 decoding, which is the most common case
-            content_str = content_bytes.decode('utf-8')
+            return raw_line.decode('utf-8')
         except UnicodeDecodeError:
-            # If it fails, try other encodings or log a warning
-            logger.warning(f"Failed to decode file '{file_path}' as UTF-8, using latin-1 with replacement characters.")
-            content_str = content_bytes.decode('latin-1', errors='replace')
-        
-        logger.info(f"  Output: Successfully retrieved and decoded file content, size {len(content_str)} bytes.")
-        return content_str
+            return raw_line.decode('latin-1', errors='replace')
 
-    @retry_on_failure(max_attempts=config.MAX_RETRY_ATTEMPTS)
+    def _iter_raw_lines(self, response: requests.Response, file_path: str) -> Iterator[bytes]:
+        """
+        Split a streamed response body into lines, holding at most one chunk plus one partial line.
+        Binary content and files over MAX_CONTEXT_FILE_BYTES are rejected as soon as they are detected.
+        """
+        content_length = response.headers.get('Content-Length')
+        if content_length and content_length.isdigit() and int(content_length) > self.max_file_bytes:
+            raise FileSkippedError(f"'{file_path}' is too large ({int(content_length)} bytes)")
+        pending = b""
+        bytes_read = 0
+        for chunk in response.iter_content(chunk_size=self.STREAM_CHUNK_SIZE):
+            if bytes_read == 0 and b"\0" in chunk[:self.BINARY_SNIFF_BYTES]:
+                raise FileSkippedError(f"'{file_path}' is a binary file")
+            bytes_read += len(chunk)
+            if bytes_read > self.max_file_bytes:
+                raise FileSkippedError(f"'{file_path}' is too large (over {self.max_file_bytes} bytes)")
+            pending += chunk
+            *lines, pending = pending.split(b"\n")
+            yield from lines
+        if pending:
+            yield pending
+
+    @retry_on_failure()
+    def _stream_file_lines(self, owner: str, repo: str, file_path: str, ref: str,
+                           line_filter: Callable[[int], bool], last_line: int) -> Tuple[Dict[int, str], int, bool]:
+        """Stream raw file content line by line, keeping only the lines accepted by line_filter"""
+        logger.info(f"[GitHub API] ==> 'stream_file_lines'")
+        logger.info(f"  Input: owner={owner}, repo={repo}, path={file_path}, ref={ref}, last_line={last_line}")
+        url = f"{self.api_url}/repos/{owner}/{repo}/contents/{file_path}"
+        headers = {"Accept": "application/vnd.github.raw"}
+
+        kept: Dict[int, str] = {}
+        lines_read = 0
+        complete = True
+        with self._request('GET', url, params={"ref": ref}, headers=headers, stream=True) as response:
+            response.raise_for_status()
+            for raw_line in self._iter_raw_lines(response, file_path):
+                if lines_read >= last_line:
+                    complete = False
+                    break
+                lines_read += 1
+                if line_filter(lines_read):
+                    kept[lines_read] = self._decode_line(raw_line)
+
+        logger.info(f"  Output: Read {lines_read} lines, kept {len(kept)}{'' if complete else ', stopped before end of file'}.")
+        return kept, lines_read, complete
+
+    @retry_on_failure()
+    def get_archive_file_contents(self, owner: str, repo: str, ref: str,
+                                  files: Dict[str, Optional[str]]) -> Dict[str, str]:
+        """
+        Get the contents of several files with a single download of the repository tarball at ref.
+        files maps each wanted path to its blob SHA (or None). The archive is read as a stream and never written
+        to disk; reading stops as soon as every wanted path has been seen. Binary and oversized files are left out.
+        """
+        logger.info(f"[GitHub API] ==> 'get_archive_file_contents'")
+        logger.info(f"  Input: owner={owner}, repo={repo}, ref={ref}, files={len(files)}")
+        url = f"{self.api_url}/repos/{owner}/{repo}/tarball/{ref}"
+
+        contents: Dict[str, str] = {}
+        remaining = set(files)
+        with self._request('GET', url, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            with tarfile.open(fileobj=response.raw, mode='r|gz') as archive:
+                for member in archive:
+                    # Archive entries are prefixed with a single '<owner>-<repo>-<sha>/' directory
+                    path = member.name.split('/', 1)[-1]
+                    if path not in remaining or not member.isfile():
+                        continue
+                    remaining.discard(path)
+                    if member.size <= self.max_file_bytes:
+                        content_bytes = archive.extractfile(member).read()
+                        if b"\0" not in content_bytes[:self.BINARY_SNIFF_BYTES]:
+                            try:
+                                content_str = content_bytes.decode('utf-8')
+                            except UnicodeDecodeError:
+                                content_str = content_bytes.decode('latin-1', errors='replace')
+                            contents[path] = content_str
+                            if self.content_cache:
+                                self.content_cache.put(FileContentCache.make_key(owner, repo, path, ref, files[path]), content_str)
+                    if not remaining:
+                        break
+
+        logger.info(f"  Output: Extracted {len(contents)} of {len(files)} files from the archive.")
+        return contents
+
+    def get_files_content_graphql(self, owner: str, repo: str, ref: str,
+                                  files: Dict[str, Optional[str]]) -> Dict[str, str]:
+        """
+        Get the contents of several files at ref through GraphQL, one aliased object(expression: "ref:path")
+        lookup per file and at most graphql_batch_size files per query.
+        files maps each wanted path to its blob SHA (or None). Paths that are missing, binary, truncated or over
+        max_file_bytes are left out of the result, so callers can fetch them through REST instead.
+        """
+        logger.info(f"[GitHub API] ==> 'get_files_content_graphql'")
+        logger.info(f"  Input: owner={owner}, repo={repo}, ref={ref}, files={len(files)}")
+        paths = list(files)
+        contents: Dict[str, str] = {}
+        for start in range(0, len(paths), self.graphql_batch_size):
+            batch = paths[start:start + self.graphql_batch_size]
+            for path, content_str in self._fetch_graphql_blob_batch(owner, repo, ref, batch).items():
+                contents[path] = content_str
+                if self.content_cache:
+                    self.content_cache.put(FileContentCache.make_key(owner, repo, path, ref, files[path]), content_str)
+
+        logger.info(f"  Output: Retrieved {len(contents)} of {len(files)} files in {math.ceil(len(paths) / self.graphql_batch_size)} queries.")
+        return contents
+
+    @retry_on_failure()
+    def _fetch_graphql_blob_batch(self, owner: str, repo: str, ref: str, paths: List[str]) -> Dict[str, str]:
+        """Run one GraphQL query for a batch of paths; expressions are passed as variables so paths need no escaping"""
+        variable_defs = "".join(f", $e{index}: String!" for index in range(len(paths)))
+        selections = "\n".join(
+            f"    f{index}: object(expression: $e{index}) {{ ... on Blob {{ text isBinary isTruncated byteSize }} }}"
+            for index in range(len(paths))
+        )
+        query = f"query($owner: String!, $name: String!{variable_defs}) {{\n  repository(owner: $owner, name: $name) {{\n{selections}\n  }}\n}}"
+        variables: Dict[str, Any] = {"owner": owner, "name": repo}
+        variables.update({f"e{index}": f"{ref}:{path}" for index, path in enumerate(paths)})
+
+        response = self._request('POST', self.graphql_url, json={"query": query, "variables": variables})
+        response.raise_for_status()
+        body = response.json()
+        repository = (body.get('data') or {}).get('repository')
+        if repository is None:
+            raise ValueError(f"GraphQL query returned no repository: {body.get('errors')}")
+        if body.get('errors'):
+            logger.warning(f"  GraphQL query returned partial errors: {body['errors']}")
+
+        contents: Dict[str, str] = {}
+        for index, path in enumerate(paths):
+            blob = repository.get(f"f{index}") or {}
+            if blob.get('text') is None or blob.get('isBinary') or blob.get('isTruncated'):
+                continue
+            if (blob.get('byteSize') or 0) > self.max_file_bytes:
+                continue
+            contents[path] = blob['text']
+        return contents
+
+    @retry_on_failure()
     def post_comment(self, owner: str, repo: str, pr_number: int, comment: str) -> Dict[str, Any]:
         """Post PR comment"""
         logger.info(f"[GitHub API] ==> 'post_comment' on PR #{pr_number}")
-        url = f"https://api.github.com/repos/{owner}/{repo}/issues/{pr_number}/comments"
-        response = self.session.post(url, json={"body": comment}, timeout=self.timeout)
+        url = f"{self.api_url}/repos/{owner}/{repo}/issues/{pr_number}/comments"
+        with metrics.time(STAGE_METRIC, stage="post_comment"):
+            response = self._request('POST', url, json={"body": comment})
         response.raise_for_status()
         response_json = response.json()
         logger.info(f"  Output: Comment successfully posted. URL: {response_json.get('html_url')}")
         return response_json
     
-    @retry_on_failure(max_attempts=config.MAX_RETRY_ATTEMPTS)
+    @retry_on_failure()
+    def update_comment(self, owner: str, repo: str, comment_id: int, comment: str) -> Dict[str, Any]:
+        """Replace the body of an existing PR comment"""
+        logger.info(f"[GitHub API] ==> 'update_comment' {comment_id}")
+        url = f"{self.api_url}/repos/{owner}/{repo}/issues/comments/{comment_id}"
+        with metrics.time(STAGE_METRIC, stage="update_comment"):
+            response = self._request('PATCH', url, json={"body": comment})
+        response.raise_for_status()
+        return response.json()
+    
+    @retry_on_failure()
     def add_label(self, owner: str, repo: str, pr_number: int, label: str) -> None:
         """Add PR label"""
         logger.info(f"[GitHub API] ==> 'add_label' on PR #{pr_number}")
-        url = f"https://api.github.com/repos/{owner}/{repo}/issues/{pr_number}/labels"
-        response = self.session.post(url, json={"labels": [label]}, timeout=self.timeout)
+        url = f"{self.api_url}/repos/{owner}/{repo}/issues/{pr_number}/labels"
+        with metrics.time(STAGE_METRIC, stage="add_label"):
+            response = self._request('POST', url, json={"labels": [label]})
         response.raise_for_status()
         logger.info(f"  Output: Label '{label}' successfully added.")
 
-github_client = GitHubClient(config.GITHUB_TOKEN, config.REQUEST_TIMEOUT)
+class GitMirrorStore:
+    """
+    Local bare git mirrors, one per repository, used to read file contents without API calls.
+    Mirrors are updated incrementally by fetching the wanted commit into refs/reviewed/<sha>, so later fetches
+    only download new objects, and are read with 'git cat-file --batch'. Only the newest MAX_REVIEWED_REFS refs of
+    a mirror are kept, and mirrors are evicted least recently used first once their total size exceeds max_bytes.
+    Mirror sizes are measured once on first use and then only re-measured after a fetch, so reads and /health do
+    not walk the mirrors.
+    """
+    MAX_REVIEWED_REFS = 200
+    def __init__(self, root_dir: str, token: str, max_bytes: int, fetch_timeout: int, max_file_bytes: int,
+                 web_url: str = "https://github.com"):
+        self.root_dir = root_dir
+        self.web_url = web_url.rstrip('/')
+        self.max_bytes = max(0, max_bytes)
+        self.fetch_timeout = fetch_timeout
+        self.max_file_bytes = max_file_bytes
+        self._token = token
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+        self.stats: Dict[str, int] = {"fetches": 0, "fetch_failures": 0, "files_read": 0, "evictions": 0}
+        self._sizes: Optional[Dict[Tuple[str, str], int]] = None  # Bytes per (owner, repo) mirror
+        self._sizes_lock = threading.Lock()
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def _repo_lock(self, owner: str, repo: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(f"{owner}/{repo}", threading.Lock())
+
+    def _mirror_path(self, owner: str, repo: str) -> str:
+        return os.path.join(self.root_dir, owner, f"{repo}.git")
+
+    def _git(self, git_dir: str, *args: str, timeout: Optional[int] = None, **kwargs: Any) -> subprocess.CompletedProcess:
+        # The token is passed through GIT_CONFIG_* variables so it is neither stored in the mirror nor visible in ps
+        credentials = base64.b64encode(f"x-access-token:{self._token}".encode('utf-8')).decode('ascii')
+        env = {**os.environ, "GIT_TERMINAL_PROMPT": "0", "GIT_CONFIG_COUNT": "1",
+               "GIT_CONFIG_KEY_0": f"http.{self.web_url}/.extraheader",
+               "GIT_CONFIG_VALUE_0": f"AUTHORIZATION: basic {credentials}"}
+        return subprocess.run(["git", f"--git-dir={git_dir}", *args], env=env, capture_output=True,
+                              timeout=timeout, check=True, **kwargs)
+
+    def _ensure_commit(self, owner: str, repo: str, git_dir: str, ref: str) -> None:
+        """Create the mirror if needed and fetch ref unless the commit is already present"""
+        if not os.path.isdir(git_dir):
+            os.makedirs(git_dir, exist_ok=True)
+            self._git(git_dir, "init", "--bare", "--quiet")
+        try:
+            self._git(git_dir, "cat-file", "-e", f"{ref}^{{commit}}")
+            return
+        except subprocess.CalledProcessError:
+            pass
+        logger.info(f"[Git Mirror] ==> fetching {ref[:7]} into mirror of {owner}/{repo}")
+        try:
+            # Fetching into a ref keeps the commit reachable (safe from gc) and lets the next fetch negotiate from it
+            self._git(git_dir, "fetch", "--quiet", "--no-tags", f"{self.web_url}/{owner}/{repo}.git",
+                      f"+{ref}:refs/reviewed/{ref}", timeout=self.fetch_timeout)
+            self.stats["fetches"] += 1
+            self._prune_refs(git_dir)
+        except (subprocess.SubprocessError, OSError):
+            self.stats["fetch_failures"] += 1
+            raise
+        finally:
+            self._record_size(owner, repo, git_dir)
+
+    def _prune_refs(self, git_dir: str) -> None:
+        """Delete all but the newest MAX_REVIEWED_REFS refs so objects of old reviews can be garbage collected"""
+        refs = self._git(git_dir, "for-each-ref", "--sort=-committerdate", "--format=%(refname)",
+                         "refs/reviewed/").stdout.decode('utf-8').split()
+        if len(refs) > self.MAX_REVIEWED_REFS:
+            commands = "".join(f"delete {name}\n" for name in refs[self.MAX_REVIEWED_REFS:])
+            self._git(git_dir, "update-ref", "--stdin", input=commands.encode('utf-8'))
+
+    def get_file_contents(self, owner: str, repo: str, ref: str, files: Dict[str, Optional[str]]) -> Dict[str, str]:
+        """
+        Get the contents of files at ref from the local mirror, fetching the commit first if it is missing.
+        files maps each wanted path to its blob SHA (or None). Missing, binary and oversized files are left out.
+        """
+        git_dir = self._mirror_path(owner, repo)
+        contents: Dict[str, str] = {}
+        with self._repo_lock(owner, repo):
+            self._ensure_commit(owner, repo, git_dir, ref)
+            os.utime(git_dir)  # Mark as recently used for eviction
+            process = subprocess.Popen(["git", f"--git-dir={git_dir}", "cat-file", "--batch"],
+                                       stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            try:
+                for path in files:
+                    # One request at a time, reading each reply before the next, so neither pipe can fill up
+                    process.stdin.write(f"{ref}:{path}\n".encode('utf-8'))
+                    process.stdin.flush()
+                    header = process.stdout.readline().split()
+                    if len(header) != 3:
+                        continue  # "<object> missing" or "<object> ambiguous"
+                    object_type, size = header[1], int(header[2])
+                    content_bytes = self._read_object(process.stdout, size)
+                    if object_type != b"blob" or content_bytes is None or b"\0" in content_bytes[:GitHubClient.BINARY_SNIFF_BYTES]:
+                        continue
+                    try:
+                        contents[path] = content_bytes.decode('utf-8')
+                    except UnicodeDecodeError:
+                        contents[path] = content_bytes.decode('latin-1', errors='replace')
+            finally:
+                process.stdin.close()
+                process.wait()
+        self.stats["files_read"] += len(contents)
+        self._evict(keep=git_dir)
+        return contents
+
+    def _read_object(self, stream: Any, size: int) -> Optional[bytes]:
+        """Read one object body plus its trailing newline; objects over max_file_bytes are drained and dropped"""
+        if size <= self.max_file_bytes:
+            content_bytes = stream.read(size)
+            stream.read(1)
+            return content_bytes
+        remaining = size + 1
+        while remaining > 0:
+            remaining -= len(stream.read(min(remaining, GitHubClient.STREAM_CHUNK_SIZE)))
+        return None
+
+    @staticmethod
+    def _dir_size(path: str) -> int:
+        total = 0
+        for dirpath, _, filenames in os.walk(path):
+            for filename in filenames:
+                try:
+                    total += os.lstat(os.path.join(dirpath, filename)).st_size
+                except OSError:
+                    pass
+        return total
+
+    def _mirror_sizes(self) -> Dict[Tuple[str, str], int]:
+        """Cached size of every mirror; mirrors left by earlier runs are measured once, on first use"""
+        with self._sizes_lock:
+            if self._sizes is None:
+                self._sizes = {}
+                for owner_entry in os.scandir(self.root_dir):
+                    if not owner_entry.is_dir():
+                        continue
+                    for repo_entry in os.scandir(owner_entry.path):
+                        if repo_entry.is_dir() and repo_entry.name.endswith('.git'):
+                            self._sizes[(owner_entry.name, repo_entry.name[:-len('.git')])] = self._dir_size(repo_entry.path)
+            return dict(self._sizes)
+
+    def _record_size(self, owner: str, repo: str, git_dir: str) -> None:
+        if self._sizes is None:
+            self._mirror_sizes()  # The first scan measures this mirror too
+            return
+        size = self._dir_size(git_dir)
+        with self._sizes_lock:
+            self._sizes[(owner, repo)] = size
+
+    def _evict(self, keep: str) -> None:
+        """Remove least recently used mirrors until the total fits max_bytes; mirrors in use are skipped"""
+        sizes = self._mirror_sizes()
+        total = sum(sizes.values())
+        if total <= self.max_bytes:
+            return
+        mirrors = []
+        for (owner, repo), size in sizes.items():
+            try:
+                mirrors.append((os.stat(self._mirror_path(owner, repo)).st_mtime, size, owner, repo))
+            except OSError:
+                mirrors.append((0.0, size, owner, repo))
+        for _, size, owner, repo in sorted(mirrors):
+            if total <= self.max_bytes:
+                break
+            git_dir = self._mirror_path(owner, repo)
+            lock = self._repo_lock(owner, repo)
+            if git_dir == keep or not lock.acquire(blocking=False):
+                continue
+            try:
+                logger.info(f"[Git Mirror] ==> evicting mirror of {owner}/{repo} ({size} bytes)")
+                shutil.rmtree(git_dir, ignore_errors=True)
+                with self._sizes_lock:
+                    self._sizes.pop((owner, repo), None)
+                total -= size
+                self.stats["evictions"] += 1
+            finally:
+                lock.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return counters and the cached disk usage"""
+        sizes = self._mirror_sizes()
+        return {**self.stats, "mirrors": len(sizes), "bytes": sum(sizes.values())}
+
+class AsyncGitHubClient:
+    """
+    Asyncio counterpart of GitHubClient for the async review pipeline (ASYNC_REVIEW), built on httpx.
+    Shares the rate limiter and file content cache with the synchronous client.
+    """
+    PER_PAGE = GitHubClient.PER_PAGE
+    RATE_LIMIT_MAX_PARKS = GitHubClient.RATE_LIMIT_MAX_PARKS
+
+    def __init__(self, token: str, timeout: int, content_cache: Optional[FileContentCache] = None,
+                 rate_limiter: Optional[GitHubRateLimiter] = None, max_file_bytes: int = 10 * 1024 * 1024,
+                 max_connections: int = 32, keepalive_seconds: int = 60, http2: bool = False,
+                 api_url: str = "https://api.github.com"):
+        self.api_url = api_url.rstrip('/')
+        self.headers = {
+            "Authorization": f"token {token}",
+            "Accept": "application/vnd.github.v3+json",
+            "X-GitHub-Api-Version": "2022-11-28"
+        }
+        self.timeout = timeout
+        self.content_cache = content_cache
+        self.rate_limiter = rate_limiter
+        self.max_file_bytes = max_file_bytes
+        self.max_connections = max(1, max_connections)
+        self.keepalive_seconds = keepalive_seconds
+        # HTTP/2 multiplexes concurrent requests over one connection; httpx needs the optional h2 package for it
+        self.http2 = http2 and importlib.util.find_spec('h2') is not None
+        if http2 and not self.http2:
+            logger.warning("HTTP2_ENABLED is set but the h2 package is not installed, using HTTP/1.1.")
+        self._client: Optional["httpx.AsyncClient"] = None
+
+    @property
+    def client(self) -> "httpx.AsyncClient":
+        # Created on first use so it is bound to the event loop that runs the reviews
+        if self._client is None:
+            import httpx  # Optional dependency of ASYNC_REVIEW, imported on first use to keep startup fast
+            limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections,
+                                  keepalive_expiry=self.keepalive_seconds)
+            self._client = httpx.AsyncClient(headers=self.headers, timeout=self.timeout, follow_redirects=True,
+                                             limits=limits, http2=self.http2)
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _request(self, method: str, url: str, **kwargs: Any) -> "httpx.Response":
+        """Send a request through the shared rate limiter, parking until the limit resets when throttled"""
+        if self.rate_limiter is None:
+            return await self.client.request(method, url, **kwargs)
+
+        for _ in range(self.RATE_LIMIT_MAX_PARKS + 1):
+            await self.rate_limiter.acquire_async()
+            response = await self.client.request(method, url, **kwargs)
+            self.rate_limiter.update(response)
+            park_seconds = self.rate_limiter.seconds_until_available(response)
+            if park_seconds is None or park_seconds > self.rate_limiter.max_wait:
+                return response
+        return response
+
+    @async_retry_on_failure()
+    async def get_pr_details(self, owner: str, repo: str, pr_number: int) -> Dict[str, Any]:
+        """Get detailed information for a single PR"""
+        logger.info(f"[GitHub API async] ==> 'get_pr_details' for PR #{pr_number}")
+        response = await self._request('GET', f"{self.api_url}/repos/{owner}/{repo}/pulls/{pr_number}")
+        response.raise_for_status()
+        return response.json()
+
+    @async_retry_on_failure()
+    async def _get_page(self, url: str, params: Optional[Dict[str, Any]] = None) -> Tuple[Any, Optional[str]]:
+        """Get one page of a paginated endpoint, returning its JSON body and the 'next' URL from the Link header"""
+        response = await self._request('GET', url, params=params)
+        response.raise_for_status()
+        return response.json(), response.links.get('next', {}).get('url')
+
+    async def get_pr_files(self, owner: str, repo: str, pr_number: int, max_files: int) -> List[Dict[str, Any]]:
+        """Get up to max_files PR file changes, fetching further pages only while more files are needed"""
+        logger.info(f"[GitHub API async] ==> 'get_pr_files' for PR #{pr_number}")
+        url: Optional[str] = f"{self.api_url}/repos/{owner}/{repo}/pulls/{pr_number}/files"
+        params: Optional[Dict[str, Any]] = {"per_page": self.PER_PAGE}
+        files: List[Dict[str, Any]] = []
+        while url and len(files) < max_files:
+            with metrics.time(STAGE_METRIC, stage="get_pr_files"):
+                page, url = await self._get_page(url, params)
+            params = None  # The 'next' URL already carries the query string
+            files.extend(page)
+        return files[:max_files]
+
+    async def compare_commits(self, owner: str, repo: str, base: str, head: str, max_files: int) -> Tuple[str, List[Dict[str, Any]]]:
+        """Compare two commits, returning the comparison status and up to max_files changed files"""
+        logger.info(f"[GitHub API async] ==> 'compare_commits' {base[:7]}...{head[:7]}")
+        url: Optional[str] = f"{self.api_url}/repos/{owner}/{repo}/compare/{base}...{head}"
+        comparison, url = await self._get_page(url, {"per_page": self.PER_PAGE})
+        status = comparison.get('status', 'unknown')
+        files = list(comparison.get('files', []))
+        while url and len(files) < max_files:
+            page, url = await self._get_page(url)
+            files.extend(page.get('files', []))
+        return status, files[:max_files]
+
+    async def get_file_lines(self, owner: str, repo: str, file_path: str, ref: str,
+                             line_filter: Callable[[int], bool], last_line: int,
+                             blob_sha: Optional[str] = None) -> FileLines:
+        """
+        Async counterpart of GitHubClient.get_file_lines_from_repo: served from the content cache when possible,
+        otherwise the raw content is streamed and reading stops after last_line.
+        """
+        cache_key = FileContentCache.make_key(owner, repo, file_path, ref, blob_sha)
+        cached_content = self.content_cache.get(cache_key) if self.content_cache else None
+        if cached_content is not None:
+            return GitHubClient._select_lines(cached_content, line_filter, last_line)
+        with metrics.time(STAGE_METRIC, stage="context_fetch"):
+            kept, lines_read, complete = await self._stream_file_lines(owner, repo, file_path, ref, line_filter, last_line)
+        if complete and self.content_cache and len(kept) == lines_read:
+            self.content_cache.put(cache_key, "\n".join(kept[number] for number in range(1, lines_read + 1)))
+        return kept, lines_read, complete
+
+    @async_retry_on_failure()
+    async def _stream_file_lines(self, owner: str, repo: str, file_path: str, ref: str,
+                                 line_filter: Callable[[int], bool], last_line: int) -> FileLines:
+        """Stream raw file content line by line, keeping only the lines accepted by line_filter"""
+        logger.info(f"[GitHub API async] ==> 'stream_file_lines' path={file_path}, ref={ref}, last_line={last_line}")
+        url = f"{self.api_url}/repos/{owner}/{repo}/contents/{file_path}"
+        for attempt in range(self.RATE_LIMIT_MAX_PARKS + 1):
+            if self.rate_limiter:
+                await self.rate_limiter.acquire_async()
+            async with self.client.stream('GET', url, params={"ref": ref},
+                                          headers={"Accept": "application/vnd.github.raw"}) as response:
+                if self.rate_limiter:
+                    self.rate_limiter.update(response)
+                    park_seconds = self.rate_limiter.seconds_until_available(response)
+                    if park_seconds is not None and park_seconds <= self.rate_limiter.max_wait and attempt < self.RATE_LIMIT_MAX_PARKS:
+                        continue
+                response.raise_for_status()
+                kept: Dict[int, str] = {}
+                lines_read = 0
+                complete = True
+                async for raw_line in self._aiter_raw_lines(response, file_path):
+                    if lines_read >= last_line:
+                        complete = False
+                        break
+                    lines_read += 1
+                    if line_filter(lines_read):
+                        kept[lines_read] = GitHubClient._decode_line(raw_line)
+                return kept, lines_read, complete
+
+    async def _aiter_raw_lines(self, response: "httpx.Response", file_path: str) -> AsyncIterator[bytes]:
+        """
+        Split a streamed body into lines, holding at most one chunk plus one partial line.
+        Binary content and files over max_file_bytes are rejected as soon as they are detected.
+        """
+        content_length = response.headers.get('Content-Length')
+        if content_length and content_length.isdigit() and int(content_length) > self.max_file_bytes:
+            raise FileSkippedError(f"'{file_path}' is too large ({int(content_length)} bytes)")
+        pending = b""
+        bytes_read = 0
+        async for chunk in response.aiter_bytes(GitHubClient.STREAM_CHUNK_SIZE):
+            if bytes_read == 0 and b"\0" in chunk[:GitHubClient.BINARY_SNIFF_BYTES]:
+                raise FileSkippedError(f"'{file_path}' is a binary file")
+            bytes_read += len(chunk)
+            if bytes_read > self.max_file_bytes:
+                raise FileSkippedError(f"'{file_path}' is too large (over {self.max_file_bytes} bytes)")
+            pending += chunk
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                yield line
+        if pending:
+            yield pending
+
+    @async_retry_on_failure()
+    async def post_comment(self, owner: str, repo: str, pr_number: int, comment: str) -> Dict[str, Any]:
+        """Post PR comment"""
+        logger.info(f"[GitHub API async] ==> 'post_comment' on PR #{pr_number}")
+        url = f"{self.api_url}/repos/{owner}/{repo}/issues/{pr_number}/comments"
+        with metrics.time(STAGE_METRIC, stage="post_comment"):
+            response = await self._request('POST', url, json={"body": comment})
+        response.raise_for_status()
+        response_json = response.json()
+        logger.info(f"  Output: Comment successfully posted. URL: {response_json.get('html_url')}")
+        return response_json
+
+    @async_retry_on_failure()
+    async def add_label(self, owner: str, repo: str, pr_number: int, label: str) -> None:
+        """Add PR label"""
+        logger.info(f"[GitHub API async] ==> 'add_label' on PR #{pr_number}")
+        url = f"{self.api_url}/repos/{owner}/{repo}/issues/{pr_number}/labels"
+        with metrics.time(STAGE_METRIC, stage="add_label"):
+            response = await self._request('POST', url, json={"labels": [label]})
+        response.raise_for_status()
+
+# Clients, caches and sessions are created per process on first use, see ProcessLocal
+github_rate_limiter = ProcessLocal(lambda: GitHubRateLimiter(config.GITHUB_REQUESTS_PER_SECOND, config.GITHUB_REQUEST_BURST,
+                                                             config.GITHUB_RATE_LIMIT_RESERVE, config.GITHUB_RATE_LIMIT_MAX_WAIT))
+file_content_cache = ProcessLocal(lambda: FileContentCache(config.FILE_CACHE_MAX_BYTES, config.FILE_CACHE_DIR,
+                                                           config.FILE_CACHE_DISK_MAX_BYTES))
+github_client = ProcessLocal(lambda: GitHubClient(
+    config.GITHUB_TOKEN, config.REQUEST_TIMEOUT, file_content_cache.instance(),
+    http_cache_max_bytes=config.HTTP_CACHE_MAX_BYTES,
+    rate_limiter=github_rate_limiter.instance(), max_file_bytes=config.MAX_CONTEXT_FILE_BYTES,
+    graphql_batch_size=config.GRAPHQL_BATCH_SIZE,
+    pool_options={"pool_connections": config.HTTP_POOL_CONNECTIONS,
+                  "pool_maxsize": config.HTTP_POOL_MAXSIZE,
+                  "pool_block": config.HTTP_POOL_BLOCK,
+                  "keepalive_seconds": config.HTTP_KEEPALIVE_SECONDS},
+    api_url=config.GITHUB_API_URL))
+
+def _create_git_mirror_store() -> Optional["GitMirrorStore"]:
+    if not config.GIT_MIRROR_DIR:
+        return None
+    if not shutil.which('git'):
+        logger.warning("GIT_MIRROR_DIR is set but git was not found on PATH, local mirror context provider disabled.")
+        return None
+    return GitMirrorStore(config.GIT_MIRROR_DIR, config.GITHUB_TOKEN, config.GIT_MIRROR_MAX_BYTES,
+                          config.GIT_MIRROR_FETCH_TIMEOUT, config.MAX_CONTEXT_FILE_BYTES,
+                          web_url=github_web_url(config.GITHUB_API_URL))
+
+git_mirror_store = ProcessLocal(_create_git_mirror_store)
+async_review_enabled = config.ASYNC_REVIEW and importlib.util.find_spec('httpx') is not None
+if config.ASYNC_REVIEW and not async_review_enabled:
+    logger.warning("ASYNC_REVIEW is enabled but httpx is not installed, falling back to threaded reviews.")
+async_github_client = ProcessLocal(lambda: AsyncGitHubClient(
+    config.GITHUB_TOKEN, config.REQUEST_TIMEOUT, file_content_cache.instance(),
+    rate_limiter=github_rate_limiter.instance(), max_file_bytes=config.MAX_CONTEXT_FILE_BYTES,
+    max_connections=config.HTTP_POOL_MAXSIZE, keepalive_seconds=config.HTTP_KEEPALIVE_SECONDS,
+    http2=config.HTTP2_ENABLED, api_url=config.GITHUB_API_URL) if async_review_enabled else None)
 
 # --- 5. Core Functionality ---
+@dataclass
+class ReviewPlan:
+    """AI prompts for a review plus the findings reused from earlier reviews of unchanged files"""
+    prompts: List[str] = field(default_factory=list)
+    chunk_files: List[List[Tuple[str, str]]] = field(default_factory=list)  # Per prompt: (filename, review cache key)
+    cached_findings: Dict[str, List[str]] = field(default_factory=dict)
+    skipped_files: List[str] = field(default_factory=list)  # Files whose diff alone exceeds the prompt budget
+    complete: bool = True  # False when some files were left out of the prompts (omitted, skipped or trimmed)
+
+class ReviewResultCache:
+    """
+    LRU cache of per-file review findings, keyed by (file path, patch hash, context hash, model, prompt version),
+    so re-reviews after a push only send the files whose review inputs changed.
+    """
+    PROMPT_VERSION = "1"  # Bump whenever the review prompt changes in a way that invalidates earlier findings
+    FINDING_PATTERN = re.compile(r'(?m)^(?=\*\*\[\d+\])')
+    LOCATION_PATTERN = re.compile(r'\*\*Code Location\*\*:\s*`([^`:]+)')
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max(0, max_entries)
+        self._entries: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def make_key(filename: str, patch: str, file_prompt: str) -> str:
+        patch_hash = hashlib.sha256(patch.encode('utf-8')).hexdigest()
+        context_hash = hashlib.sha256(file_prompt.encode('utf-8')).hexdigest()
+        key_parts = [filename, patch_hash, context_hash, config.AI_MODEL_NAME,
+                     ReviewResultCache.PROMPT_VERSION, config.OUTPUT_LANGUAGE]
+        return hashlib.sha256("\0".join(key_parts).encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        if not self.max_entries:
+            return None
+        with self._lock:
+            findings = self._entries.get(key)
+            if findings is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return list(findings)
+
+    def put(self, key: str, findings: List[str]) -> None:
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = list(findings)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries)}
+
+    @staticmethod
+    def split_findings(review_text: str) -> List[str]:
+        """Split a review into its numbered findings"""
+        blocks = ReviewResultCache.FINDING_PATTERN.split(review_text)
+        return [block.strip().rstrip('-').strip() for block in blocks[1:]]
+
+    def store_review(self, review_text: str, files: List[Tuple[str, str]]) -> None:
+        """Attribute the findings of a review to the reviewed files and cache them per file"""
+        findings_by_file: Dict[str, List[str]] = {filename: [] for filename, _ in files}
+        for finding in self.split_findings(review_text):
+            location = self.LOCATION_PATTERN.search(finding)
+            filename = location.group(1).strip() if location else None
+            matches = [name for name in findings_by_file if filename and (name == filename or name.endswith('/' + filename))]
+            if len(matches) != 1:
+                # A finding that cannot be attributed to exactly one file makes per-file reuse unsafe
+                logger.info("  Review findings could not be attributed to files, not caching them.")
+                return
+            findings_by_file[matches[0]].append(finding)
+        for filename, cache_key in files:
+            self.put(cache_key, findings_by_file[filename])
+
+review_result_cache = ReviewResultCache(config.REVIEW_CACHE_MAX_ENTRIES)
+
+class ReviewedHeadStore:
+    """Remembers the last reviewed head SHA per PR (bounded, least recently updated PRs are forgotten first)"""
+    MAX_ENTRIES = 10000
+
+    def __init__(self):
+        self._heads: "OrderedDict[Tuple[str, str, int], str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, owner: str, repo: str, pr_number: int) -> Optional[str]:
+        with self._lock:
+            return self._heads.get((owner, repo, pr_number))
+
+    def set(self, owner: str, repo: str, pr_number: int, head_sha: str) -> None:
+        with self._lock:
+            self._heads[(owner, repo, pr_number)] = head_sha
+            self._heads.move_to_end((owner, repo, pr_number))
+            while len(self._heads) > self.MAX_ENTRIES:
+                self._heads.popitem(last=False)
+
+reviewed_heads = ReviewedHeadStore()
+
+STREAM_PLACEHOLDER = "_⏳ UllrAI is reviewing this pull request. Findings will appear here as they are ready._"
+STREAM_IN_PROGRESS_NOTE = "_⏳ Review in progress..._"
+STREAM_INTERRUPTED_NOTE = "_[The review was interrupted before it was complete; the findings above are partial.]_"
+STREAM_SUPERSEDED_NOTE = "_This review was superseded by a newer push and has been withdrawn._"
+STREAM_FAILED_NOTE = "_The review of this pull request could not be completed._"
+
 class PRReviewer:
     """PR review core logic"""
 
+    HUNK_HEADER_PATTERN = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@", re.MULTILINE)
+
     @staticmethod
-    def _get_context_line_from_patch(patch: str) -> int:
-        """Parse the starting line number of changes from patch string"""
-        match = re.search(r"@@ -(\d+),?\d* \+", patch)
-        return int(match.group(1)) if match else 1
+    def _get_hunk_ranges(patch: str) -> List[Tuple[int, int]]:
+        """Parse the new-file line range (1-based, inclusive) of every hunk in a patch"""
+        ranges = []
+        for match in PRReviewer.HUNK_HEADER_PATTERN.finditer(patch or ''):
+            start = int(match.group(1))
+            count = int(match.group(2)) if match.group(2) is not None else 1
+            # A pure deletion has count 0 and points at the line before the removed block
+            ranges.append((max(1, start), max(1, start) + max(count, 1) - 1))
+        return ranges
 
     @staticmethod
-    def create_review_prompt(files: List[Dict[str, Any]], pr_data: Dict[str, Any]) -> str:
-        """Create AI review prompt, optionally including file context"""
-        logger.info("[Step] Creating AI review prompt...")
-        files = files[:config.MAX_FILES_PER_REVIEW]
+    def _get_context_windows(patch: str, padding: int, line_budget: int) -> List[Tuple[int, int]]:
+        """
+        Pad every hunk's new-file range by `padding` lines, merge overlapping windows and
+        trim the result so that at most `line_budget` lines are kept (earlier windows first).
+        """
+        ranges = PRReviewer._get_hunk_ranges(patch) or [(1, 1)]
+        padded = sorted((max(1, start - padding), end + padding) for start, end in ranges)
+        
+        merged: List[Tuple[int, int]] = []
+        for start, end in padded:
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+
+        windows = []
+        remaining = line_budget
+        for start, end in merged:
+            if remaining <= 0:
+                break
+            end = min(end, start + remaining - 1)
+            windows.append((start, end))
+            remaining -= end - start + 1
+        return windows
+
+    @staticmethod
+    def _render_context_windows(lines: Dict[int, str], total_lines: int,
+                                windows: List[Tuple[int, int]]) -> Tuple[str, List[Tuple[int, int]]]:
+        """Join the given 1-based windows of lines, returning the text and the windows clamped to the file"""
+        snippets = []
+        clamped = []
+        for start, end in windows:
+            end = min(end, total_lines)
+            if start > end:
+                continue
+            clamped.append((start, end))
+            snippets.append(f"// Lines {start}-{end}\n" + "\n".join(lines.get(number, "") for number in range(start, end + 1)))
+        return "\n// ...\n".join(snippets), clamped
+
+    # Files with these extensions are never downloaded for context
+    BINARY_FILE_EXTENSIONS = (
+        '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.ico', '.webp', '.pdf', '.zip', '.gz', '.tgz', '.bz2', '.xz',
+        '.7z', '.tar', '.jar', '.war', '.whl', '.exe', '.dll', '.so', '.dylib', '.a', '.o', '.class', '.pyc',
+        '.woff', '.woff2', '.ttf', '.otf', '.eot', '.mp3', '.mp4', '.mov', '.avi', '.wav', '.bin', '.dat',
+    )
+
+    @staticmethod
+    def _select_context_lines(patch: str) -> Tuple[List[Tuple[int, int]], Callable[[int], bool], int]:
+        """
+        Return the hunk windows of a patch, the filter of the lines kept as context and the last line to read.
+        Only the first CONTEXT_MAX_LINES lines and the lines inside the hunk windows are kept.
+        """
+        windows = PRReviewer._get_context_windows(patch, config.CONTEXT_SURROUNDING_LINES, config.CONTEXT_SNIPPET_MAX_LINES)
+        max_full_lines = config.CONTEXT_MAX_LINES
+
+        def line_filter(number: int) -> bool:
+            return number <= max_full_lines or any(start <= number <= end for start, end in windows)
+
+        return windows, line_filter, max(max_full_lines + 1, windows[-1][1])
+
+    @staticmethod
+    def _build_file_context(owner: str, repo: str, file: Dict[str, Any], head_sha: str,
+                            prefetched: Optional[Dict[str, Union[str, FileLines, Exception]]] = None) -> str:
+        """
+        Get the modified file and render its context section for the prompt.
+        Reading stops once the last needed line is reached, so memory per file stays bounded even for huge files.
+        prefetched maps file names to their full content, or to the lines (or the error) of _fetch_context_async.
+        """
+        filename = file.get('filename', 'unknown')
+        patch = file.get('patch', '')
+        try:
+            windows, line_filter, last_line = PRReviewer._select_context_lines(patch)
+            max_full_lines = config.CONTEXT_MAX_LINES
+
+            # Get the modified file lines from head commit
+            prefetched_entry = (prefetched or {}).get(filename)
+            if isinstance(prefetched_entry, Exception):
+                # Already attempted by the async pipeline; render its outcome instead of fetching again
+                raise prefetched_entry
+            if isinstance(prefetched_entry, tuple):
+                lines, lines_read, complete = prefetched_entry
+            else:
+                lines, lines_read, complete = github_client.get_file_lines_from_repo(
+                    owner, repo, filename, head_sha, line_filter, last_line=last_line, blob_sha=file.get('sha'),
+                    prefetched_content=prefetched_entry
+                )
+            
+            context_header = "### Modified File Context"
+            if complete and lines_read <= max_full_lines:
+                context_content = "\n".join(lines[number] for number in range(1, lines_read + 1))
+                context_header += " (Complete file)"
+                logger.info(f"  - Included complete file content for '{filename}' ({lines_read} lines).")
+            else:
+                context_content, windows = PRReviewer._render_context_windows(lines, lines_read, windows)
+                line_ranges = ", ".join(f"{start}-{end}" for start, end in windows)
+                context_header += f" (Code snippets of lines {line_ranges})"
+                logger.info(f"  - Extracted {len(windows)} code snippets for '{filename}' ({sum(end - start + 1 for start, end in windows)} lines).")
+
+            return f"{context_header}\n```\n{context_content}\n```\n\n"
+        except FileSkippedError as e:
+            logger.info(f"  - Skipped context for '{filename}': {e}")
+            metrics.inc("pr_reviewer_context_skipped_files_total", reason="binary_or_too_large")
+            return "_[Modified file context skipped: binary or too large]_\n\n"
+        except Exception as e:
+            logger.warning(f"  - Unable to get context for '{filename}': {e}")
+            metrics.inc("pr_reviewer_context_skipped_files_total", reason="error")
+            return "_[Unable to get modified file context]_\n\n"
+
+    @staticmethod
+    def _needs_context(file: Dict[str, Any]) -> bool:
+        """Whether the head version of a file should be downloaded as context"""
+        # GitHub omits the patch for binary files and oversized diffs, so there is nothing to anchor context to
+        filename = file.get('filename', '')
+        return bool(config.INCLUDE_FILE_CONTEXT and file.get('status', 'modified') == 'modified'
+                    and file.get('patch') and not filename.lower().endswith(PRReviewer.BINARY_FILE_EXTENSIONS))
+
+    @staticmethod
+    def _prefetch_context(owner: str, repo: str, head_sha: str, files: List[Dict[str, Any]]) -> Dict[str, str]:
+        """
+        Download the context of several files at once instead of one request per file.
+        CONTEXT_PROVIDER 'mirror', 'tarball' and 'graphql' force a bulk provider; 'auto' uses the local git mirror
+        when GIT_MIRROR_DIR is set, otherwise the head commit tarball for at least CONTEXT_TARBALL_THRESHOLD uncached
+        files and batched GraphQL for two or more.
+        Returns an empty mapping otherwise or on failure; files missing from the result are fetched on their own.
+        """
+        wanted = {file.get('filename'): file.get('sha') for file in files
+                  if not file_content_cache.contains(FileContentCache.make_key(owner, repo, file.get('filename'), head_sha, file.get('sha')))}
+        provider = config.CONTEXT_PROVIDER
+        if provider == 'auto':
+            provider = ('mirror' if git_mirror_store
+                        else 'tarball' if len(wanted) >= config.CONTEXT_TARBALL_THRESHOLD
+                        else 'graphql' if len(wanted) >= 2 else 'rest')
+        if not wanted or provider not in ('mirror', 'tarball', 'graphql') or (provider == 'mirror' and not git_mirror_store):
+            return {}
+        try:
+            logger.info(f"  - Fetching context of {len(wanted)} files through the {provider} provider.")
+            with metrics.time(STAGE_METRIC, stage="context_prefetch", provider=provider):
+                if provider == 'mirror':
+                    return git_mirror_store.get_file_contents(owner, repo, head_sha, wanted)
+                if provider == 'tarball':
+                    return github_client.get_archive_file_contents(owner, repo, head_sha, wanted)
+                return github_client.get_files_content_graphql(owner, repo, head_sha, wanted)
+        except Exception as e:
+            logger.warning(f"  - Bulk context fetch through {provider} failed, falling back to per-file requests: {e}")
+            return {}
+
+    @staticmethod
+    def _iter_file_sections(files: Iterable[Dict[str, Any]], pr_data: Dict[str, Any],
+                            prefetched: Optional[Dict[str, Union[str, FileLines, Exception]]] = None) -> Iterator[Tuple[Dict[str, Any], str]]:
+        """
+        Yield (file, prompt section) for each file in order.
+        Files are pulled lazily, so a paginated source stops being read once the consumer stops iterating.
+        """
+        file_iter = itertools.islice(files, config.MAX_FILES_PER_REVIEW)
         
         repo_info = pr_data.get("base", {}).get("repo", {})
         owner = repo_info.get("owner", {}).get("login")
         repo = repo_info.get("name")
-        base_sha = pr_data.get("base", {}).get("sha")
         head_sha = pr_data.get("head", {}).get("sha")
 
-        prompt_parts = []
-        total_length = 0
+        def needs_context(file: Dict[str, Any]) -> bool:
+            return bool(head_sha and owner and repo and PRReviewer._needs_context(file))
+
+        # Callers that fetched context themselves pass it in as prefetched
+        if prefetched is None and config.INCLUDE_FILE_CONTEXT and config.CONTEXT_PROVIDER != 'rest':
+            # Choosing a provider needs the file count up front; MAX_FILES_PER_REVIEW keeps this read bounded
+            review_files = list(file_iter)
+            file_iter = iter(review_files)
+            prefetched = PRReviewer._prefetch_context(owner, repo, head_sha, [file for file in review_files if needs_context(file)])
+
+        # Context downloads run concurrently a bounded number of files ahead; results are consumed in file order below
+        concurrency = max(1, config.CONTEXT_FETCH_CONCURRENCY)
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="context-fetch")
+        pending: "deque[Tuple[Dict[str, Any], Optional[Future]]]" = deque()
+
+        def fill_pending() -> None:
+            while len(pending) < concurrency * 2:
+                file = next(file_iter, None)
+                if file is None:
+                    return
+                context_future = (executor.submit(PRReviewer._build_file_context, owner, repo, file, head_sha, prefetched)
+                                  if needs_context(file) else None)
+                pending.append((file, context_future))
         
-        for file in files:
-            filename = file.get('filename', 'unknown')
-            patch = file.get('patch', '')
-            status = file.get('status', 'modified')
-            
-            file_prompt = f"## File: `{filename}` (Status: {status})\n\n"
+        try:
+            fill_pending()
+            while pending:
+                file, context_future = pending.popleft()
+                fill_pending()
+                filename = file.get('filename', 'unknown')
+                patch = file.get('patch', '')
+                status = file.get('status', 'modified')
+                
+                file_prompt = f"## File: `{filename}` (Status: {status})\n\n"
 
-            # 1. Add modified file context (if enabled and file is modified)
-            if config.INCLUDE_FILE_CONTEXT and status == 'modified' and head_sha and owner and repo:
-                try:
-                    # Get the modified file content from head commit
-                    modified_content = github_client.get_file_content_from_repo(
-                        owner, repo, filename, head_sha
-                    )
-                    lines = modified_content.splitlines()
-                    
-                    context_header = "### Modified File Context"
-                    if len(lines) > config.CONTEXT_MAX_LINES:
-                        start_line = PRReviewer._get_context_line_from_patch(patch)
-                        slice_start = max(0, start_line - config.CONTEXT_SURROUNDING_LINES)
-                        slice_end = min(len(lines), start_line + config.CONTEXT_SURROUNDING_LINES)
-                        context_content = "\n".join(lines[slice_start:slice_end])
-                        context_header += f" (Code snippet around line {start_line})"
-                        logger.info(f"  - Extracted code snippet for '{filename}' ({slice_end - slice_start} lines).")
-                    else:
-                        context_content = modified_content
-                        context_header += " (Complete file)"
-                        logger.info(f"  - Included complete file content for '{filename}' ({len(lines)} lines).")
-
-                    file_prompt += f"{context_header}\n```\n{context_content}\n```\n\n"
-                except Exception as e:
-                    logger.warning(f"  - Unable to get context for '{filename}': {e}")
-                    file_prompt += "_[Unable to get modified file context]_\n\n"
+                # 1. Add modified file context (if enabled and file is modified)
+                if context_future is not None:
+                    file_prompt += context_future.result()
 
-            # 2. Add Diff
-            safe_patch = patch.replace("```", "`` `") if patch else "_No changes_"
-            file_prompt += f"### Diff for This Commit\n```diff\n{safe_patch}\n```\n\n---\n\n"
-            
-            if total_length + len(file_prompt) > config.MAX_PROMPT_LENGTH:
-                logger.warning(f"  Prompt length reached limit. Stopped after processing {len(prompt_parts)} files.")
-                prompt_parts.append("\n_[More files omitted due to total length limit...]_")
-                break
-            
-            prompt_parts.append(file_prompt)
-            total_length += len(file_prompt)
+                # 2. Add Diff
+                safe_patch = patch.replace("```", "`` `") if patch else "_No changes_"
+                file_prompt += f"### Diff for This Commit\n```diff\n{safe_patch}\n```\n\n---\n\n"
+                yield file, file_prompt
+        finally:
+            # Drop context downloads that are no longer needed once the consumer stops
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def create_review_prompt(files: Iterable[Dict[str, Any]], pr_data: Dict[str, Any]) -> str:
+        """Create a single AI review prompt, omitting the files that do not fit the prompt budget"""
+        return PRReviewer.create_review_prompts(files, pr_data, max_chunks=1)[0]
+
+    @staticmethod
+    def create_review_prompts(files: Iterable[Dict[str, Any]], pr_data: Dict[str, Any], max_chunks: int = 1) -> List[str]:
+        """Create AI review prompts for all files, without reusing cached findings"""
+        return PRReviewer.plan_review(files, pr_data, max_chunks, use_cache=False).prompts
+
+    @staticmethod
+    def plan_review(files: Iterable[Dict[str, Any]], pr_data: Dict[str, Any], max_chunks: int = 1,
+                    use_cache: bool = True, scope_note: str = "",
+                    prefetched: Optional[Dict[str, Union[str, FileLines, Exception]]] = None) -> ReviewPlan:
+        """
+        Create AI review prompts, optionally including file context.
+        Files whose review inputs are unchanged since an earlier review reuse its findings instead of being sent again.
+        The remaining files are packed in order into up to max_chunks prompts that each fit the token budget;
+        files beyond the last chunk are omitted. A file too large for any prompt is skipped and listed in skipped_files.
+        No prompt is created for a chunk without files.
+        """
+        logger.info("[Step] Creating AI review prompt...")
+        max_chunks = max(1, max_chunks)
+        plan = ReviewPlan()
+        token_limit = PRReviewer._get_prompt_token_limit()
+        # Tokens left for the per-file sections once the instructions and PR description are accounted for
+        overhead_prompt = PRReviewer._render_prompt(pr_data, "", scope_note + PRReviewer._get_part_note(max_chunks, max_chunks))
+        token_budget = token_limit - token_estimator.estimate(overhead_prompt)
+
+        batches: List[List[str]] = [[]]
+        plan.chunk_files.append([])
+        batch_tokens = 0
+        batch_length = 0
+        omitted = False
+
+        def fits(file_tokens: int, file_length: int) -> bool:
+            return batch_tokens + file_tokens <= token_budget and (
+                not config.MAX_PROMPT_LENGTH or batch_length + file_length <= config.MAX_PROMPT_LENGTH)
+
+        sections = PRReviewer._iter_file_sections(files, pr_data, prefetched)
+        try:
+            for file, file_prompt in sections:
+                filename = file.get('filename', 'unknown')
+                cache_key = ReviewResultCache.make_key(filename, file.get('patch', ''), file_prompt)
+                cached = review_result_cache.get(cache_key) if use_cache else None
+                if cached is not None:
+                    logger.info(f"  - '{filename}': unchanged since an earlier review, reusing {len(cached)} findings.")
+                    plan.cached_findings[filename] = cached
+                    continue
+
+                file_tokens = token_estimator.estimate(file_prompt)
+                if file_tokens > token_budget or (config.MAX_PROMPT_LENGTH and len(file_prompt) > config.MAX_PROMPT_LENGTH):
+                    logger.warning(f"  - '{filename}': ~{file_tokens} tokens, larger than the whole prompt budget ({token_budget} tokens), skipped.")
+                    plan.skipped_files.append(filename)
+                    continue
+                if not fits(file_tokens, len(file_prompt)) and batches[-1] and len(batches) < max_chunks:
+                    batches.append([])
+                    plan.chunk_files.append([])
+                    batch_tokens = batch_length = 0
+                if not fits(file_tokens, len(file_prompt)):
+                    files_processed = sum(len(batch) for batch in batches)
+                    logger.warning(f"  Prompt budget reached limit (~{batch_tokens} of {token_budget} tokens). Stopped after processing {files_processed} files.")
+                    omitted = True
+                    break
+                
+                logger.info(f"  - '{filename}': ~{file_tokens} tokens (chunk {len(batches)}).")
+                batches[-1].append(file_prompt)
+                plan.chunk_files[-1].append((filename, cache_key))
+                batch_length += len(file_prompt)
+                batch_tokens += file_tokens
+        finally:
+            sections.close()
+
+        if not batches[-1]:
+            # Every remaining file was served from the review cache or skipped
+            batches.pop()
+            plan.chunk_files.pop()
 
+        chunk_files, plan.chunk_files = plan.chunk_files, []
+        trimmed = False
+        for index, (batch, files_in_batch) in enumerate(zip(batches, chunk_files), start=1):
+            part_note = scope_note + PRReviewer._get_part_note(index, len(batches))
+            batch_omitted = omitted and index == len(batches)
+            prompt = PRReviewer._assemble_prompt(pr_data, batch, batch_omitted, part_note)
+            if config.TOKEN_COUNT_CALIBRATION:
+                prompt = PRReviewer._verify_prompt_tokens(pr_data, batch, batch_omitted, prompt, token_limit, part_note)
+                # Files trimmed to fit the model's limit were not reviewed and must not be cached
+                trimmed = trimmed or len(files_in_batch) > len(batch)
+                del files_in_batch[len(batch):]
+            if not files_in_batch:
+                logger.warning(f"  Chunk {index} holds no files after trimming, not sending it to AI.")
+                continue
+            plan.prompts.append(prompt)
+            plan.chunk_files.append(files_in_batch)
+        plan.complete = not (omitted or trimmed or plan.skipped_files)
+        
+        total_files = sum(len(batch) for batch in batches)
+        logger.info(f"  Output: Prompt creation completed. Chunks: {len(plan.prompts)}. Length: {sum(len(p) for p in plan.prompts)} characters, ~{sum(token_estimator.estimate(p) for p in plan.prompts)} tokens. Files processed: {total_files}. Files reused from cache: {len(plan.cached_findings)}.")
+        return plan
+
+    @staticmethod
+    def _get_part_note(index: int, total: int) -> str:
+        if total <= 1:
+            return ""
+        return (f"_Note: This pull request is too large for a single review and is reviewed in {total} parts. "
+                f"This is part {index} of {total}; review only the files below._\n\n")
+
+    @staticmethod
+    def _assemble_prompt(pr_data: Dict[str, Any], prompt_parts: List[str], omitted: bool, part_note: str = "") -> str:
         diffs_text = "".join(prompt_parts)
+        if omitted:
+            diffs_text += "\n_[More files omitted due to total length limit...]_"
+        return PRReviewer._render_prompt(pr_data, diffs_text, part_note)
+
+    @staticmethod
+    def _verify_prompt_tokens(pr_data: Dict[str, Any], prompt_parts: List[str], omitted: bool,
+                              prompt: str, token_limit: int, part_note: str = "") -> str:
+        """
+        Count the prompt with the model's tokenizer, recalibrate the local estimator, and drop
+        trailing files if the estimate was too optimistic, so Gemini never rejects the request.
+        """
+        try:
+            actual_tokens = count_model_tokens(prompt)
+        except Exception as e:
+            logger.warning(f"  Unable to count prompt tokens with the model, relying on the local estimate: {e}")
+            return prompt
+        estimated_tokens = token_estimator.estimate(prompt)
+        logger.info(f"  Prompt tokens: {actual_tokens} counted by model, {estimated_tokens} estimated locally.")
+        token_estimator.calibrate(prompt, actual_tokens)
+
+        if actual_tokens > token_limit:
+            scale = actual_tokens / max(1, estimated_tokens)
+            while actual_tokens > token_limit and prompt_parts:
+                actual_tokens -= math.floor(token_estimator.estimate(prompt_parts.pop()) * scale)
+            prompt = PRReviewer._assemble_prompt(pr_data, prompt_parts, True, part_note)
+            logger.warning(f"  Prompt exceeded {token_limit} tokens, trimmed to {len(prompt_parts)} files.")
+        return prompt
+
+    @staticmethod
+    def _get_prompt_token_limit() -> int:
+        """Token limit for the prompt: MAX_PROMPT_TOKENS, capped by the model's input token limit"""
+        model_limit = get_model_input_token_limit()
+        if config.MAX_PROMPT_TOKENS > 0 and model_limit:
+            return min(config.MAX_PROMPT_TOKENS, model_limit)
+        return config.MAX_PROMPT_TOKENS or model_limit or TokenEstimator.DEFAULT_TOKEN_LIMIT
+
+    @staticmethod
+    def _render_prompt(pr_data: Dict[str, Any], diffs_text: str, part_note: str = "") -> str:
+        """Render the full review prompt around the per-file sections"""
         pr_title = pr_data.get('title', '')
         pr_body = pr_data.get('body', '')
 
         # Language instruction based on OUTPUT_LANGUAGE setting
         language_instruction = PRReviewer._get_language_instruction(config.OUTPUT_LANGUAGE)
         
-        prompt = f"""# Review Instructions
+        return f"""# Review Instructions
 Please conduct a professional and thorough review of the following code changes. You have access to both the modified file content (showing the final state after changes) and the diff (showing what was changed). Your goal is to identify potential issues and provide specific, constructive modification suggestions. Follow GitHub Code Review best practices, keep comments objective and concise, and prioritize by importance and urgency.
 
 # Review Focus Areas
@@ -308,12 +2178,9 @@ For each file, you will see:
 
 Use both pieces of information together to understand the full context and impact of the changes.
 
-{diffs_text}
+{part_note}{diffs_text}
 
 Please start your review comments directly without any opening remarks.{language_instruction}"""
-        
-        logger.info(f"  Output: Prompt creation completed. Length: {len(prompt)} characters. Files processed: {len(prompt_parts)}.")
-        return prompt
 
     @staticmethod
     def _get_language_instruction(output_language: str) -> str:
@@ -323,12 +2190,13 @@ Please start your review comments directly without any opening remarks.{language
         return ''
     
     @staticmethod
-    @retry_on_failure(max_attempts=config.MAX_RETRY_ATTEMPTS, delay=config.RETRY_DELAY)
+    @retry_on_failure()
     def get_ai_review(prompt: str) -> str:
         """Call AI to get review comments"""
         logger.info("[Step] Calling Gemini AI for code review...")
         try:
-            response = ai_model.generate_content(prompt)
+            with metrics.time(STAGE_METRIC, stage="ai_review"):
+                response = ai_model.generate_content(prompt)
             review_text = response.text
             logger.info(f"  Output: Successfully received AI review comments, length {len(review_text)} characters.")
             return review_text
@@ -337,8 +2205,285 @@ Please start your review comments directly without any opening remarks.{language
             raise
 
     @staticmethod
-    def process_pr_review(pr_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Process complete PR review workflow"""
+    @retry_on_failure()
+    def stream_ai_review(prompt: str, on_update: Callable[[str], None],
+                         is_cancelled: Optional[Callable[[], bool]] = None) -> str:
+        """
+        Call AI with a streamed response. on_update receives the text up to the last completed paragraph at most
+        every STREAM_UPDATE_INTERVAL seconds. Errors before any text arrived are retried; if the stream dies later,
+        the partial review is returned with a note instead. Stops early when is_cancelled returns True.
+        """
+        logger.info("[Step] Calling Gemini AI for code review (streaming)...")
+        review_text = ""
+        posted_length = 0
+        last_update = time.monotonic()
+        with metrics.time(STAGE_METRIC, stage="ai_review"):
+            try:
+                for chunk in ai_model.generate_content(prompt, stream=True):
+                    if chunk.candidates:
+                        review_text += "".join(part.text for part in chunk.parts)
+                    if is_cancelled and is_cancelled():
+                        logger.info("  Review cancelled, stopping the stream.")
+                        return f"{review_text.rstrip()}\n\n{STREAM_INTERRUPTED_NOTE}"
+                    completed_length = review_text.rfind("\n\n")
+                    if completed_length > posted_length and time.monotonic() - last_update >= config.STREAM_UPDATE_INTERVAL:
+                        try:
+                            on_update(review_text[:completed_length])
+                            posted_length = completed_length
+                        except Exception as e:
+                            logger.warning(f"  Unable to publish review progress: {e}")
+                        last_update = time.monotonic()
+            except Exception as e:
+                if not review_text:
+                    logger.error(f"  Error occurred during AI call: {e}")
+                    raise
+                logger.warning(f"  AI stream interrupted after {len(review_text)} characters, keeping the partial review: {e}")
+                metrics.inc("pr_reviewer_stream_interruptions_total")
+                return f"{review_text.rstrip()}\n\n{STREAM_INTERRUPTED_NOTE}"
+        if not review_text:
+            raise ValueError("AI returned no review text. The prompt or response may have been blocked.")
+        logger.info(f"  Output: Successfully received AI review comments, length {len(review_text)} characters.")
+        return review_text
+
+    @staticmethod
+    @async_retry_on_failure()
+    async def get_ai_review_async(prompt: str) -> str:
+        """Call AI to get review comments without blocking the event loop"""
+        logger.info("[Step] Calling Gemini AI for code review (async)...")
+        with metrics.time(STAGE_METRIC, stage="ai_review"):
+            if config.GEMINI_TRANSPORT == "rest":
+                # The REST transport has no async client, keep the loop free by calling it from a thread
+                response = await asyncio.to_thread(ai_model.generate_content, prompt)
+            else:
+                response = await ai_model.generate_content_async(prompt)
+        review_text = response.text
+        logger.info(f"  Output: Successfully received AI review comments, length {len(review_text)} characters.")
+        return review_text
+
+    @staticmethod
+    def get_partial_ai_reviews(prompts: List[str]) -> List[Optional[str]]:
+        """Review each chunk of an oversized PR concurrently; returns one review per chunk (None if it failed)"""
+        logger.info(f"[Step] Reviewing {len(prompts)} chunks concurrently (max {config.AI_REVIEW_CONCURRENCY} at a time)...")
+        with ThreadPoolExecutor(max_workers=max(1, min(config.AI_REVIEW_CONCURRENCY, len(prompts))),
+                                thread_name_prefix="ai-review") as executor:
+            futures = [executor.submit(PRReviewer.get_ai_review, prompt) for prompt in prompts]
+        return PRReviewer._collect_partial_reviews([future.exception() or future.result() for future in futures])
+
+    @staticmethod
+    def _collect_partial_reviews(outcomes: List[Any]) -> List[Optional[str]]:
+        """
+        Map chunk outcomes (review texts or exceptions) to reviews aligned with their chunk, None for failed chunks.
+        Fails only if every chunk failed.
+        """
+        chunk_reviews: List[Optional[str]] = []
+        errors = []
+        for index, outcome in enumerate(outcomes, start=1):
+            if isinstance(outcome, BaseException):
+                logger.warning(f"  Review of chunk {index}/{len(outcomes)} failed: {outcome}")
+                errors.append(outcome)
+                chunk_reviews.append(None)
+            else:
+                chunk_reviews.append(outcome)
+        if len(errors) == len(outcomes):
+            raise errors[0]
+        return chunk_reviews
+
+    @staticmethod
+    def _store_chunk_reviews(chunk_reviews: List[Optional[str]], chunk_files: List[List[Tuple[str, str]]]) -> List[str]:
+        """
+        Cache the findings of the chunks that were reviewed and return their reviews for consolidation.
+        Files of failed chunks are not cached, so they are sent to AI again on the next review.
+        """
+        partial_reviews = []
+        for chunk_review, files in zip(chunk_reviews, chunk_files):
+            if chunk_review is not None:
+                review_result_cache.store_review(chunk_review, files)
+                partial_reviews.append(chunk_review)
+        failed = len(chunk_reviews) - len(partial_reviews)
+        if failed:
+            partial_reviews.append(f"_[{failed} of {len(chunk_reviews)} parts of this pull request could not be reviewed.]_")
+        return partial_reviews
+
+    @staticmethod
+    def consolidate_reviews(partial_reviews: List[str], pr_data: Dict[str, Any],
+                            review: Optional[Callable[[str], str]] = None) -> str:
+        """Merge and de-duplicate the findings of chunked reviews into a single review"""
+        logger.info(f"[Step] Consolidating {len(partial_reviews)} partial reviews...")
+        try:
+            return (review or PRReviewer.get_ai_review)(PRReviewer._build_consolidation_prompt(partial_reviews, pr_data))
+        except Exception as e:
+            logger.warning(f"  Consolidation failed, posting partial reviews as they are: {e}")
+            return "\n\n---\n\n".join(partial_reviews)
+
+    @staticmethod
+    async def get_partial_ai_reviews_async(prompts: List[str]) -> List[Optional[str]]:
+        """Async counterpart of get_partial_ai_reviews"""
+        logger.info(f"[Step] Reviewing {len(prompts)} chunks concurrently (max {config.AI_REVIEW_CONCURRENCY} at a time)...")
+        semaphore = asyncio.Semaphore(max(1, config.AI_REVIEW_CONCURRENCY))
+
+        async def review(prompt: str) -> str:
+            async with semaphore:
+                return await PRReviewer.get_ai_review_async(prompt)
+
+        outcomes = await asyncio.gather(*(review(prompt) for prompt in prompts), return_exceptions=True)
+        return PRReviewer._collect_partial_reviews(list(outcomes))
+
+    @staticmethod
+    async def consolidate_reviews_async(partial_reviews: List[str], pr_data: Dict[str, Any]) -> str:
+        """Async counterpart of consolidate_reviews"""
+        logger.info(f"[Step] Consolidating {len(partial_reviews)} partial reviews...")
+        try:
+            return await PRReviewer.get_ai_review_async(PRReviewer._build_consolidation_prompt(partial_reviews, pr_data))
+        except Exception as e:
+            logger.warning(f"  Consolidation failed, posting partial reviews as they are: {e}")
+            return "\n\n---\n\n".join(partial_reviews)
+
+    @staticmethod
+    def _build_consolidation_prompt(partial_reviews: List[str], pr_data: Dict[str, Any]) -> str:
+        """Build the prompt that merges the findings of chunked reviews"""
+        parts_text = "\n\n".join(f"## Part {index}\n{review}" for index, review in enumerate(partial_reviews, start=1))
+        language_instruction = PRReviewer._get_language_instruction(config.OUTPUT_LANGUAGE)
+        return f"""# Task
+The following are {len(partial_reviews)} partial code reviews of the same pull request, each covering a different subset of its files. Merge them into a single review: remove duplicate findings, keep the most specific version of each finding, order findings by importance and urgency, and number them sequentially. Keep the finding template and Markdown formatting used in the partial reviews. Do not add new findings. If no part found any issues, clearly state so.
+
+# PR Context
+*   **Title**: {pr_data.get('title', '')}
+
+# Partial Reviews
+{parts_text}
+
+Please start your review comments directly without any opening remarks.{language_instruction}"""
+
+    @staticmethod
+    def _get_review_files(owner: str, repo: str, pr_number: int, head_sha: Optional[str]) -> Tuple[Iterator[Dict[str, Any]], Optional[str]]:
+        """
+        Return the files to review and, in incremental mode, the previously reviewed head they are diffed against.
+        Falls back to the full PR diff when there is no earlier review or the history was rewritten.
+        """
+        last_reviewed_sha = reviewed_heads.get(owner, repo, pr_number) if config.INCREMENTAL_REVIEW else None
+        if last_reviewed_sha and head_sha and last_reviewed_sha != head_sha:
+            try:
+                status, files = github_client.compare_commits(owner, repo, last_reviewed_sha, head_sha)
+                if status == 'ahead':
+                    logger.info(f"  Incremental review of PR #{pr_number} since {last_reviewed_sha[:7]}.")
+                    return files, last_reviewed_sha
+                logger.info(f"  Head of PR #{pr_number} is '{status}' relative to {last_reviewed_sha[:7]}, reviewing the full diff.")
+            except Exception as e:
+                logger.warning(f"  Unable to compare PR #{pr_number} with the last reviewed commit, reviewing the full diff: {e}")
+        return github_client.iter_pr_files(owner, repo, pr_number), None
+
+    @staticmethod
+    async def _get_review_files_async(owner: str, repo: str, pr_number: int,
+                                      head_sha: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Async counterpart of _get_review_files; returns at most MAX_FILES_PER_REVIEW files"""
+        last_reviewed_sha = reviewed_heads.get(owner, repo, pr_number) if config.INCREMENTAL_REVIEW else None
+        if last_reviewed_sha and head_sha and last_reviewed_sha != head_sha:
+            try:
+                status, files = await async_github_client.compare_commits(owner, repo, last_reviewed_sha, head_sha,
+                                                                          config.MAX_FILES_PER_REVIEW)
+                if status == 'ahead':
+                    logger.info(f"  Incremental review of PR #{pr_number} since {last_reviewed_sha[:7]}.")
+                    return files, last_reviewed_sha
+                logger.info(f"  Head of PR #{pr_number} is '{status}' relative to {last_reviewed_sha[:7]}, reviewing the full diff.")
+            except Exception as e:
+                logger.warning(f"  Unable to compare PR #{pr_number} with the last reviewed commit, reviewing the full diff: {e}")
+        return await async_github_client.get_pr_files(owner, repo, pr_number, config.MAX_FILES_PER_REVIEW), None
+
+    @staticmethod
+    async def _fetch_context_async(owner: str, repo: str, head_sha: Optional[str],
+                                   files: List[Dict[str, Any]]) -> Dict[str, Union[FileLines, Exception]]:
+        """
+        Fetch the context lines of every file that needs context, at most CONTEXT_FETCH_CONCURRENCY at a time.
+        Like the sync path, only the lines selected by _select_context_lines are kept and reading stops after the last one.
+        A failed or skipped file maps to its error, which _build_file_context renders without fetching the file again.
+        """
+        if not (head_sha and owner and repo):
+            return {}
+        semaphore = asyncio.Semaphore(max(1, config.CONTEXT_FETCH_CONCURRENCY))
+
+        async def fetch(file: Dict[str, Any]) -> Union[FileLines, Exception]:
+            async with semaphore:
+                try:
+                    _, line_filter, last_line = PRReviewer._select_context_lines(file.get('patch', ''))
+                    return await async_github_client.get_file_lines(owner, repo, file['filename'], head_sha,
+                                                                    line_filter, last_line, file.get('sha'))
+                except Exception as e:
+                    # Logged and counted once, when _build_file_context renders the file
+                    return e
+
+        context_files = [file for file in files if PRReviewer._needs_context(file)]
+        contents = await asyncio.gather(*(fetch(file) for file in context_files))
+        return {file['filename']: content for file, content in zip(context_files, contents)}
+
+    @staticmethod
+    def _append_cached_findings(review_comment: str, cached_findings: Dict[str, List[str]]) -> str:
+        """Add the findings reused for unchanged files to the review comment"""
+        if not cached_findings:
+            return review_comment
+        findings = [finding for file_findings in cached_findings.values() for finding in file_findings]
+        renumbered = [re.sub(r'^\*\*\[\d+\]', f'**[{index}]', finding) for index, finding in enumerate(findings, start=1)]
+        section = (f"### Unchanged Files\n_{len(cached_findings)} files are unchanged since an earlier review; "
+                   f"their findings are repeated below ({len(findings)} findings)._")
+        if renumbered:
+            section += "\n\n---\n" + "\n\n---\n".join(renumbered) + "\n\n---"
+        return f"{review_comment}\n\n{section}" if review_comment else section
+
+    @staticmethod
+    def _append_skipped_files(review_comment: str, skipped_files: List[str]) -> str:
+        """Tell readers which files were too large to be reviewed"""
+        if not skipped_files:
+            return review_comment
+        note = ("_Not reviewed because the diff alone exceeds the prompt budget: "
+                + ", ".join(f"`{filename}`" for filename in skipped_files) + "._")
+        return f"{review_comment}\n\n{note}" if review_comment else note
+
+    @staticmethod
+    def _get_scope_note(since_sha: Optional[str]) -> str:
+        if not since_sha:
+            return ""
+        return (f"_Note: This is an incremental review. Only the changes pushed since the previously reviewed "
+                f"commit `{since_sha[:7]}` are shown below; earlier changes in this pull request were already reviewed._\n\n")
+
+    @staticmethod
+    def _add_comment_footer(review_comment: str, since_sha: Optional[str]) -> str:
+        scope_footer = f" for changes since `{since_sha[:7]}`" if since_sha else ""
+        return f"{review_comment}\n\n---\n*🤖 This comment was generated by UllrAI Code Review Assistant using {config.AI_MODEL_NAME} model{scope_footer}*"
+
+    @staticmethod
+    def _post_placeholder(owner: str, repo: str, pr_number: int, since_sha: Optional[str]) -> int:
+        """Post the comment that a streamed review is written into"""
+        comment = github_client.post_comment(owner, repo, pr_number, PRReviewer._add_comment_footer(STREAM_PLACEHOLDER, since_sha))
+        return comment["id"]
+
+    @staticmethod
+    def _replace_placeholder(owner: str, repo: str, comment_id: int, note: str) -> None:
+        """Replace a streamed review that will not be completed with a short note, best effort"""
+        try:
+            github_client.update_comment(owner, repo, comment_id, note)
+        except Exception as e:
+            logger.warning(f"  Unable to update review comment {comment_id}: {e}")
+
+    @staticmethod
+    def _record_reviewed_head(owner: str, repo: str, pr_number: int, head_sha: Optional[str], reviewed_all: bool) -> None:
+        """
+        Remember head_sha as the base of the next incremental review, but only if every file was reviewed;
+        otherwise the previous head is kept so the next review covers the files left out this time.
+        """
+        if not head_sha:
+            return
+        if reviewed_all:
+            reviewed_heads.set(owner, repo, pr_number, head_sha)
+        else:
+            logger.info(f"  Review of PR #{pr_number} did not cover every file, keeping the previous reviewed head.")
+
+    @staticmethod
+    def process_pr_review(pr_data: Dict[str, Any], is_superseded: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
+        """
+        Process complete PR review workflow.
+        is_superseded is polled before the AI call and before posting, so reviews of an outdated head are dropped.
+        With STREAM_REVIEW, a placeholder comment is posted before the AI call and edited in place as the review streams in.
+        """
+        comment_id = None
         start_time = time.time()
         pr_number = pr_data['number']
         repo_info = pr_data.get("base", {}).get("repo", {})
@@ -349,36 +2494,417 @@ Please start your review comments directly without any opening remarks.{language
         result = {"pr_number": pr_number, "status": "success", "message": "", "duration": 0}
         
         try:
-            files = github_client.get_pr_files(owner, repo, pr_number)
-            if not files:
+            if pr_data.get("details_pending"):
+                pr_data = github_client.get_pr_details(owner, repo, pr_number)
+            head_sha = pr_data.get("head", {}).get("sha")
+            files, since_sha = PRReviewer._get_review_files(owner, repo, pr_number, head_sha)
+            first_file = next(files, None)
+            if first_file is None:
                 result.update({"status": "skipped", "message": "PR has no file changes."})
                 return result
             
-            prompt = PRReviewer.create_review_prompt(files, pr_data)
-            review_comment = PRReviewer.get_ai_review(prompt)
+            scope_note = PRReviewer._get_scope_note(since_sha)
+            max_chunks = config.MAX_REVIEW_CHUNKS if config.CHUNKED_REVIEW else 1
+            with metrics.time(STAGE_METRIC, stage="prompt_build"):
+                plan = PRReviewer.plan_review(itertools.chain([first_file], files), pr_data, max_chunks, scope_note=scope_note)
+            if is_superseded and is_superseded():
+                result.update({"status": "superseded", "message": "A newer push superseded this review before the AI call."})
+                return result
+            review = PRReviewer.get_ai_review
+            if config.STREAM_REVIEW and plan.prompts:
+                comment_id = PRReviewer._post_placeholder(owner, repo, pr_number, since_sha)
+
+                def publish(text: str) -> None:
+                    github_client.update_comment(owner, repo, comment_id,
+                                                 PRReviewer._add_comment_footer(f"{text}\n\n{STREAM_IN_PROGRESS_NOTE}", since_sha))
+
+                def review(prompt: str) -> str:
+                    return PRReviewer.stream_ai_review(prompt, publish, is_superseded)
+            reviewed_all = plan.complete
+            if not plan.prompts:
+                review_comment = ""
+            elif len(plan.prompts) == 1:
+                review_comment = review(plan.prompts[0])
+                if not review_comment.endswith(STREAM_INTERRUPTED_NOTE):
+                    review_result_cache.store_review(review_comment, plan.chunk_files[0])
+            else:
+                chunk_reviews = PRReviewer.get_partial_ai_reviews(plan.prompts)
+                reviewed_all = reviewed_all and None not in chunk_reviews
+                partial_reviews = PRReviewer._store_chunk_reviews(chunk_reviews, plan.chunk_files)
+                if is_superseded and is_superseded():
+                    result.update({"status": "superseded", "message": "A newer push superseded this review before consolidation."})
+                    return result
+                review_comment = PRReviewer.consolidate_reviews(partial_reviews, pr_data, review)
+            reviewed_all = reviewed_all and not review_comment.endswith(STREAM_INTERRUPTED_NOTE)
+            review_comment = PRReviewer._append_cached_findings(review_comment, plan.cached_findings)
+            review_comment = PRReviewer._append_skipped_files(review_comment, plan.skipped_files)
+            if is_superseded and is_superseded():
+                result.update({"status": "superseded", "message": "A newer push superseded this review, comment not posted."})
+                return result
             
-            comment_with_footer = f"{review_comment}\n\n---\n*🤖 This comment was generated by UllrAI Code Review Assistant using {config.AI_MODEL_NAME} model*"
-            github_client.post_comment(owner, repo, pr_number, comment_with_footer)
+            comment_with_footer = PRReviewer._add_comment_footer(review_comment, since_sha)
+            if comment_id:
+                github_client.update_comment(owner, repo, comment_id, comment_with_footer)
+            else:
+                github_client.post_comment(owner, repo, pr_number, comment_with_footer)
+            comment_id = None
             github_client.add_label(owner, repo, pr_number, config.REVIEW_LABEL)
+            PRReviewer._record_reviewed_head(owner, repo, pr_number, head_sha, reviewed_all)
             
-            result["message"] = f"Successfully reviewed {len(files)} files."
+            result["message"] = f"Successfully reviewed {pr_data.get('changed_files', 'all')} files."
             
         except Exception as e:
             result.update({"status": "error", "message": str(e)})
             logger.error(f"--- PR #{pr_number} review process failed: {e} ---", exc_info=True)
         
         finally:
+            if comment_id:
+                PRReviewer._replace_placeholder(owner, repo, comment_id, STREAM_SUPERSEDED_NOTE if result["status"] == "superseded"
+                                                else STREAM_FAILED_NOTE)
             duration = round(time.time() - start_time, 2)
             result["duration"] = duration
+            metrics.inc("pr_reviewer_reviews_total", status=result["status"])
             logger.info(f"PR #{pr_number} total processing duration: {duration} seconds. Result: {result['status']}")
         
         return result
 
+    @staticmethod
+    async def process_pr_review_async(pr_data: Dict[str, Any], is_superseded: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
+        """
+        Async counterpart of process_pr_review: GitHub and Gemini calls are awaited instead of holding a thread.
+        Prompt planning is CPU work and runs in a worker thread with the context fetched up front.
+        """
+        start_time = time.time()
+        pr_number = pr_data['number']
+        repo_info = pr_data.get("base", {}).get("repo", {})
+        owner = repo_info.get("owner", {}).get("login")
+        repo = repo_info.get("name")
+        
+        logger.info(f"--- Starting async review process for PR #{pr_number} in {owner}/{repo} ---")
+        result = {"pr_number": pr_number, "status": "success", "message": "", "duration": 0}
+        
+        try:
+            if pr_data.get("details_pending"):
+                pr_data = await async_github_client.get_pr_details(owner, repo, pr_number)
+            head_sha = pr_data.get("head", {}).get("sha")
+            files, since_sha = await PRReviewer._get_review_files_async(owner, repo, pr_number, head_sha)
+            if not files:
+                result.update({"status": "skipped", "message": "PR has no file changes."})
+                return result
+            
+            prefetched = await PRReviewer._fetch_context_async(owner, repo, head_sha, files)
+            max_chunks = config.MAX_REVIEW_CHUNKS if config.CHUNKED_REVIEW else 1
+            with metrics.time(STAGE_METRIC, stage="prompt_build"):
+                plan = await asyncio.to_thread(PRReviewer.plan_review, files, pr_data, max_chunks,
+                                               scope_note=PRReviewer._get_scope_note(since_sha), prefetched=prefetched)
+            if is_superseded and is_superseded():
+                result.update({"status": "superseded", "message": "A newer push superseded this review before the AI call."})
+                return result
+            reviewed_all = plan.complete
+            if not plan.prompts:
+                review_comment = ""
+            elif len(plan.prompts) == 1:
+                review_comment = await PRReviewer.get_ai_review_async(plan.prompts[0])
+                review_result_cache.store_review(review_comment, plan.chunk_files[0])
+            else:
+                chunk_reviews = await PRReviewer.get_partial_ai_reviews_async(plan.prompts)
+                reviewed_all = reviewed_all and None not in chunk_reviews
+                partial_reviews = PRReviewer._store_chunk_reviews(chunk_reviews, plan.chunk_files)
+                if is_superseded and is_superseded():
+                    result.update({"status": "superseded", "message": "A newer push superseded this review before consolidation."})
+                    return result
+                review_comment = await PRReviewer.consolidate_reviews_async(partial_reviews, pr_data)
+            review_comment = PRReviewer._append_cached_findings(review_comment, plan.cached_findings)
+            review_comment = PRReviewer._append_skipped_files(review_comment, plan.skipped_files)
+            if is_superseded and is_superseded():
+                result.update({"status": "superseded", "message": "A newer push superseded this review, comment not posted."})
+                return result
+            
+            await async_github_client.post_comment(owner, repo, pr_number, PRReviewer._add_comment_footer(review_comment, since_sha))
+            await async_github_client.add_label(owner, repo, pr_number, config.REVIEW_LABEL)
+            PRReviewer._record_reviewed_head(owner, repo, pr_number, head_sha, reviewed_all)
+            
+            result["message"] = f"Successfully reviewed {pr_data.get('changed_files', 'all')} files."
+            
+        except Exception as e:
+            result.update({"status": "error", "message": str(e)})
+            logger.error(f"--- PR #{pr_number} review process failed: {e} ---", exc_info=True)
+        
+        finally:
+            duration = round(time.time() - start_time, 2)
+            result["duration"] = duration
+            metrics.inc("pr_reviewer_reviews_total", status=result["status"])
+            logger.info(f"PR #{pr_number} total processing duration: {duration} seconds. Result: {result['status']}")
+        
+        return result
+
+class AsyncReviewRunner:
+    """
+    Event loop on a background thread that runs async reviews.
+    At most max_in_flight reviews run at once; submit() blocks the calling worker until a slot is free,
+    so jobs waiting for a slot stay queued (and can still be superseded).
+    """
+    def __init__(self, max_in_flight: int):
+        self.max_in_flight = max(1, max_in_flight)
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the loop thread on first use so it is created inside the serving process"""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="async-review-loop", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def acquire_slot(self) -> None:
+        self._slots.acquire()
+
+    def release_slot(self) -> None:
+        self._slots.release()
+
+    def submit(self, pr_data: Dict[str, Any], is_superseded: Optional[Callable[[], bool]] = None) -> Future:
+        """Schedule a review on the loop, holding a slot (taken with acquire_slot) until it finishes"""
+        with self._lock:
+            self._in_flight += 1
+        future = asyncio.run_coroutine_threadsafe(PRReviewer.process_pr_review_async(pr_data, is_superseded),
+                                                  self._ensure_loop())
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, _: Future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return self._in_flight
+
+class ReviewJobQueue:
+    """
+    Bounded in-process job queue drained by a pool of review worker threads.
+    Jobs are coalesced per PR: a new event supersedes older jobs of the same PR, and every job waits out a
+    debounce window first, so a burst of pushes results in a single review of the newest head.
+    """
+    MAX_TRACKED_JOBS = 1000
+    FINISHED_STATUSES = ("done", "failed", "superseded")
+
+    def __init__(self, num_workers: int, max_size: int, debounce_seconds: float = 0.0,
+                 async_runner: Optional[AsyncReviewRunner] = None):
+        self.num_workers = max(1, num_workers)
+        self.async_runner = async_runner
+        self.max_size = max(0, max_size)
+        self.debounce_seconds = max(0.0, debounce_seconds)
+        self._queue: "queue.Queue[Tuple[str, Dict[str, Any]]]" = queue.Queue()
+        self._delayed: List[Tuple[float, str, Dict[str, Any]]] = []  # Heap of (ready_at, job_id, pr_data)
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._latest_job_by_pr: Dict[Tuple[str, str, int], str] = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._delayed_ready = threading.Condition(self._lock)
+        self._workers: List[threading.Thread] = []
+
+    @staticmethod
+    def _pr_key(pr_data: Dict[str, Any]) -> Tuple[str, str, int]:
+        repo_info = pr_data.get("base", {}).get("repo", {})
+        return (repo_info.get("owner", {}).get("login"), repo_info.get("name"), pr_data.get('number'))
+
+    def _ensure_workers(self) -> None:
+        """Start worker threads on first use so they are created inside the serving process"""
+        with self._lock:
+            self._workers = [w for w in self._workers if w.is_alive()]
+            if self.debounce_seconds > 0 and not any(w.name == "review-dispatcher" for w in self._workers):
+                dispatcher = threading.Thread(target=self._dispatch_loop, name="review-dispatcher", daemon=True)
+                dispatcher.start()
+                self._workers.append(dispatcher)
+            num_review_workers = sum(1 for w in self._workers if w.name.startswith("review-worker-"))
+            for i in range(num_review_workers, self.num_workers):
+                worker = threading.Thread(target=self._worker_loop, name=f"review-worker-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def submit(self, pr_data: Dict[str, Any]) -> Optional[str]:
+        """Enqueue a review job and return its ID, or None if the queue is full"""
+        self._ensure_workers()
+        job_id = uuid.uuid4().hex
+        pr_key = self._pr_key(pr_data)
+        job = {"job_id": job_id, "pr_number": pr_data.get('number'), "head_sha": pr_data.get("head", {}).get("sha"),
+               "status": "queued", "enqueued_at": time.time(), "result": None}
+        with self._lock:
+            previous_job_id = self._latest_job_by_pr.get(pr_key)
+            previous_job = self._jobs.get(previous_job_id) if previous_job_id else None
+            supersedes_queued = bool(previous_job and previous_job["status"] == "queued")
+            # A queued job of the same PR gives up its slot to the new one, so only reject if the queue stays full
+            if self.max_size and self._pending - supersedes_queued >= self.max_size:
+                logger.warning(f"Review queue is full ({self.max_size} jobs), rejecting PR #{pr_data.get('number')}.")
+                return None
+            if supersedes_queued:
+                # Not started yet: drop it outright. A running job notices on its own via is_superseded().
+                previous_job.update(status="superseded", finished_at=time.time(),
+                                    result={"status": "superseded", "message": f"Superseded by job {job_id}."})
+                self._pending -= 1
+                logger.info(f"  Review job {previous_job_id} for PR #{job['pr_number']} superseded by job {job_id}.")
+            self._latest_job_by_pr[pr_key] = job_id
+            self._jobs[job_id] = job
+            self._pending += 1
+            self._trim_jobs()
+            if self.debounce_seconds > 0:
+                heapq.heappush(self._delayed, (time.monotonic() + self.debounce_seconds, job_id, pr_data))
+                self._delayed_ready.notify()
+            else:
+                self._queue.put((job_id, pr_data))
+        logger.info(f"  Output: Enqueued review job {job_id} for PR #{job['pr_number']}. Queue depth: {self.depth()}.")
+        return job_id
+
+    def is_superseded(self, job_id: str, pr_key: Tuple[str, str, int]) -> bool:
+        """Whether a newer event for the same PR has arrived since this job was enqueued"""
+        with self._lock:
+            return self._latest_job_by_pr.get(pr_key) != job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a snapshot of the job state"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._pending
+
+    def running(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job["status"] == "running")
+
+    def _trim_jobs(self) -> None:
+        """Forget the oldest finished jobs once the tracking table is full (caller holds the lock)"""
+        overflow = len(self._jobs) - self.MAX_TRACKED_JOBS
+        if overflow <= 0:
+            return
+        finished = [jid for jid, job in self._jobs.items() if job["status"] in self.FINISHED_STATUSES]
+        for jid in finished[:overflow]:
+            del self._jobs[jid]
+
+    def _set_status(self, job_id: str, **updates: Any) -> None:
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(updates)
+
+    def _dispatch_loop(self) -> None:
+        """Move jobs whose debounce window has elapsed onto the ready queue"""
+        with self._delayed_ready:
+            while True:
+                if not self._delayed:
+                    self._delayed_ready.wait()
+                    continue
+                ready_at, job_id, pr_data = self._delayed[0]
+                wait = ready_at - time.monotonic()
+                if wait > 0:
+                    self._delayed_ready.wait(wait)
+                    continue
+                heapq.heappop(self._delayed)
+                if self._jobs.get(job_id, {}).get("status") == "queued":
+                    self._queue.put((job_id, pr_data))
+
+    def _worker_loop(self) -> None:
+        while True:
+            job_id, pr_data = self._queue.get()
+            pr_key = self._pr_key(pr_data)
+            if self.async_runner:
+                self._hand_off(job_id, pr_data, pr_key)
+                continue
+            try:
+                if not self._start_job(job_id):
+                    continue
+                result = PRReviewer.process_pr_review(pr_data, is_superseded=lambda: self.is_superseded(job_id, pr_key))
+                self._finish_job(job_id, pr_key, result)
+            except Exception as e:
+                self._finish_job(job_id, pr_key, error=e)
+            finally:
+                self._queue.task_done()
+
+    def _hand_off(self, job_id: str, pr_data: Dict[str, Any], pr_key: Tuple[str, str, int]) -> None:
+        """Pass a job to the async runner once it has a free slot; the worker does not wait for the review"""
+        try:
+            self.async_runner.acquire_slot()
+            if not self._start_job(job_id):
+                self.async_runner.release_slot()
+                return
+            future = self.async_runner.submit(pr_data, is_superseded=lambda: self.is_superseded(job_id, pr_key))
+            future.add_done_callback(lambda f: self._finish_job(job_id, pr_key, f.result()) if f.exception() is None
+                                     else self._finish_job(job_id, pr_key, error=f.exception()))
+        finally:
+            self._queue.task_done()
+
+    def _start_job(self, job_id: str) -> bool:
+        """Mark a job as running; returns False if it was superseded or forgotten while queued"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != "queued":
+                return False
+            job.update(status="running", started_at=time.time())
+            self._pending -= 1
+            return True
+
+    def _finish_job(self, job_id: str, pr_key: Tuple[str, str, int], result: Optional[Dict[str, Any]] = None,
+                    error: Optional[BaseException] = None) -> None:
+        if error is not None:
+            logger.error(f"Review job {job_id} crashed: {error}", exc_info=error)
+            self._set_status(job_id, status="failed", finished_at=time.time(),
+                             result={"status": "error", "message": str(error)})
+        else:
+            status = "superseded" if result.get("status") == "superseded" else "done"
+            self._set_status(job_id, status=status, finished_at=time.time(), result=result)
+        with self._lock:
+            if self._latest_job_by_pr.get(pr_key) == job_id:
+                del self._latest_job_by_pr[pr_key]
+
+async_review_runner = ProcessLocal(lambda: AsyncReviewRunner(config.ASYNC_MAX_IN_FLIGHT) if async_review_enabled else None)
+review_queue = ProcessLocal(lambda: ReviewJobQueue(config.REVIEW_WORKERS, config.REVIEW_QUEUE_SIZE, config.REVIEW_DEBOUNCE_SECONDS,
+                                                   async_runner=async_review_runner.instance()))
+metrics.describe("pr_reviewer_queue_depth", "gauge", "Review jobs waiting to start",
+                 lambda: [({}, review_queue.depth())])
+metrics.describe("pr_reviewer_reviews_in_flight", "gauge", "Reviews currently running",
+                 lambda: [({}, review_queue.running())])
+metrics.describe("pr_reviewer_github_rate_limit_remaining", "gauge", "Last X-RateLimit-Remaining seen from GitHub, by rate limit resource",
+                 lambda: [({"resource": resource}, remaining) for resource, remaining
+                          in github_rate_limiter.snapshot()["remaining_by_resource"].items()])
+
+def _http_pool_samples(field: str) -> List[Tuple[Dict[str, str], float]]:
+    """Sum a field of GitHubClient.pool_stats() per host; several adapters of the session can pool the same host"""
+    totals: Dict[str, float] = {}
+    for stats in github_client.pool_stats():
+        totals[stats["host"]] = totals.get(stats["host"], 0) + stats[field]
+    return [({"host": host}, value) for host, value in totals.items()]
+
+metrics.describe("pr_reviewer_http_pool_connections_in_use", "gauge", "Pooled GitHub connections currently checked out, by host",
+                 lambda: _http_pool_samples("in_use"))
+metrics.describe("pr_reviewer_http_pool_connections_idle", "gauge", "Pooled GitHub connections waiting for reuse, by host",
+                 lambda: _http_pool_samples("idle"))
+metrics.describe("pr_reviewer_http_pool_reused_requests_total", "counter", "Requests sent over an already open GitHub connection, by host",
+                 lambda: _http_pool_samples("reused_requests"))
+
 # --- 6. Web Endpoints ---
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({"status": "healthy", "service": "pr-reviewer", "version": "2.0.0", "model": config.AI_MODEL_NAME})
+    return jsonify({"status": "healthy", "service": "pr-reviewer", "version": "2.0.0", "model": config.AI_MODEL_NAME,
+                    "queue_depth": review_queue.depth(),
+                    "async_reviews_in_flight": async_review_runner.in_flight() if async_review_runner else None,
+                    "file_cache": file_content_cache.snapshot(),
+                    "http_cache": github_client.http_cache.snapshot() if github_client.http_cache else None,
+                    "http_pools": github_client.pool_stats(),
+                    "github_rate_limit": github_rate_limiter.snapshot(), "retries": retry_stats.snapshot(),
+                    "review_cache": review_result_cache.snapshot(),
+                    "git_mirrors": git_mirror_store.snapshot() if git_mirror_store else None})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus metrics endpoint"""
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.route('/webhook', methods=['POST'])
 def github_webhook():
@@ -390,34 +2916,85 @@ def github_webhook():
     # Webhook signature verification removed, no need to configure GITHUB_WEBHOOK_SECRET
     
     try:
-        data = request.json
-        should_process, pr_data = should_process_event(data, event_type)
+        with metrics.time(STAGE_METRIC, stage="webhook_parse"):
+            body = request.get_data()
+            skip_reason = prefilter_event(event_type, body)
+            data = None if skip_reason else decode_json(body)
+        if skip_reason:
+            logger.info(f"Event (Delivery ID: {delivery_id}) skipped before parsing: {skip_reason}")
+            metrics.inc("pr_reviewer_webhook_events_total", event=event_type, outcome="filtered")
+            return jsonify({"status": "skipped", "reason": "Event does not meet processing conditions."}), 200
+        with metrics.time(STAGE_METRIC, stage="should_process_event"):
+            should_process, pr_data = should_process_event(data, event_type)
         
         if not should_process:
             logger.info(f"Event (Delivery ID: {delivery_id}) does not need processing, skipped.")
+            metrics.inc("pr_reviewer_webhook_events_total", event=event_type, outcome="skipped")
             return jsonify({"status": "skipped", "reason": "Event does not meet processing conditions."}), 200
         
         pr_number = pr_data.get('number')
         logger.info(f"Event '{event_type}' (PR #{pr_number}) will be processed.")
         
-        # Asynchronous processing can be implemented here (currently synchronous processing)
-        result = PRReviewer.process_pr_review(pr_data)
+        job_id = review_queue.submit(pr_data)
+        if job_id is None:
+            metrics.inc("pr_reviewer_webhook_events_total", event=event_type, outcome="rejected")
+            return jsonify({"status": "error", "message": "Review queue is full, please retry later."}), 503
         
-        return jsonify(result), 200
+        metrics.inc("pr_reviewer_webhook_events_total", event=event_type, outcome="queued")
+        return jsonify({"status": "queued", "job_id": job_id, "pr_number": pr_number}), 202
         
     except Exception as e:
+        metrics.inc("pr_reviewer_webhook_events_total", event=event_type, outcome="error")
         logger.error(f"Uncaught error occurred while processing Webhook, Delivery ID: {delivery_id}: {e}", exc_info=True)
         return jsonify({"status": "error", "message": str(e)}), 500
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id: str):
+    """Review job status endpoint"""
+    job = review_queue.get_job(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job)
+
+# Webhook events and actions that can start a review
+WEBHOOK_TARGET_ACTIONS = {'pull_request': ('opened', 'synchronize', 'reopened'), 'issue_comment': ('created',)}
+LEADING_ACTION_PATTERN = re.compile(rb'\s*\{\s*"action"\s*:\s*"([^"\\]*)"')  # GitHub sends "action" as the first key
+REVIEW_COMMAND_PATTERN = re.compile(rb'/review', re.IGNORECASE)
+
+def prefilter_event(event_type: str, body: bytes) -> Optional[str]:
+    """
+    Cheap checks on the X-GitHub-Event header and the raw body that reject most irrelevant deliveries before
+    the JSON is decoded. Returns the reason to skip, or None if the payload must be decoded and checked by
+    should_process_event.
+    """
+    target_actions = WEBHOOK_TARGET_ACTIONS.get(event_type)
+    if target_actions is None:
+        return f"Event '{event_type}' is not a target event."
+    match = LEADING_ACTION_PATTERN.match(body)
+    action = match.group(1).decode('utf-8', errors='replace') if match else None
+    if action is not None and action not in target_actions:
+        return f"Event '{event_type}.{action}' is not a target event."
+    if event_type == 'issue_comment' and not REVIEW_COMMAND_PATTERN.search(body):
+        return "Comment does not contain '/review' trigger command."
+    return None
+
+def decode_json(body: bytes) -> Any:
+    """Decode a JSON payload, with orjson when it is installed"""
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
 def should_process_event(data: Dict[str, Any], event_type: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
-    """Determine whether to process the event and return complete PR data object"""
+    """
+    Determine whether to process the event and return the PR data object.
+    For '/review' comments only the PR number and repository are known; the object is marked 'details_pending'
+    and the review worker fetches the full PR details.
+    """
     repo_info = data.get('repository', {})
     owner = repo_info.get('owner', {}).get('login')
     repo = repo_info.get('name')
     logger.info(f"[Step] Determining if event '{event_type}' for '{owner}/{repo}' needs processing...")
     action = data.get('action')
 
-    if event_type == 'pull_request' and action in ['opened', 'synchronize', 'reopened']:
+    if event_type == 'pull_request' and action in WEBHOOK_TARGET_ACTIONS['pull_request']:
         pr_data = data.get('pull_request', {})
         if pr_data and not pr_data.get('draft', False):
             logger.info(f"  Output: Processing 'pull_request.{action}' event for PR #{pr_data.get('number')}.")
@@ -425,17 +3002,14 @@ def should_process_event(data: Dict[str, Any], event_type: str) -> Tuple[bool, O
         else:
             logger.info("  Output: Skipped. PR is a draft.")
 
-    elif event_type == 'issue_comment' and action == 'created':
+    elif event_type == 'issue_comment' and action in WEBHOOK_TARGET_ACTIONS['issue_comment']:
         if 'pull_request' in data.get('issue', {}):
             comment_body = data.get('comment', {}).get('body', '')
             if '/review' in comment_body.lower():
                 pr_number = data.get('issue', {}).get('number')
-                try:
-                    pr_data = github_client.get_pr_details(owner, repo, pr_number)
-                    logger.info(f"  Output: Processing 'issue_comment' event for PR #{pr_number} (triggered by '/review').")
-                    return True, pr_data
-                except Exception as e:
-                    logger.error(f"  Unable to get PR #{pr_number} details for comment-triggered review: {e}")
+                logger.info(f"  Output: Processing 'issue_comment' event for PR #{pr_number} (triggered by '/review').")
+                # The comment payload has no head or base details; the review worker fetches them
+                return True, {"number": pr_number, "base": {"repo": repo_info}, "details_pending": True}
             else:
                 logger.info("  Output: Skipped. Comment does not contain '/review' trigger command.")
         else:
@@ -466,6 +3040,7 @@ if __name__ == '__main__':
     logger.info(f"Listening on port: {port}")
     logger.info(f"AI Model: {config.AI_MODEL_NAME}")
     logger.info(f"Include file context: {config.INCLUDE_FILE_CONTEXT}")
+    logger.info(f"Review workers: {config.REVIEW_WORKERS}, queue size: {config.REVIEW_QUEUE_SIZE}")
     logger.info("="*50)
     
     # For production environment, recommend using Gunicorn or uWSGI
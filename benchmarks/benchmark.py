@@ -0,0 +1,392 @@
+"""
+Offline benchmark for the PR reviewer.
+
+Runs the real app (webhook endpoint, job queue, GitHubClient, prompt building and the Gemini client) against
+local stand-ins started in a separate process:
+
+* a stub GitHub REST server serving PR files, file contents, comments and labels
+* a stub Gemini REST backend with configurable latency and token throughput
+
+Webhook deliveries are replayed at a target rate and the script reports throughput, per-stage latency
+percentiles (p50/p95/p99) and the peak RSS of the app process.
+
+Usage:
+    python benchmarks/benchmark.py --deliveries 200 --rate 20
+    python benchmarks/benchmark.py --corpus deliveries.jsonl --json results.json
+
+A corpus is a JSON Lines file with one delivery per line:
+    {"event": "pull_request", "payload": {...}, "files": [...], "contents": {"path": "text"}}
+"files" (the PR files API response) and "contents" (head versions of files) are optional; missing data is
+generated deterministically from the PR number. App settings can be overridden through the usual environment
+variables (e.g. CONTEXT_PROVIDER, REVIEW_WORKERS, ASYNC_REVIEW).
+"""
+import os
+import re
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+import resource
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+OWNER = "bench"
+REPO = "repo"
+
+
+# --- Synthetic data ---
+def make_file_content(path: str, lines: int) -> str:
+    rng = random.Random(path)
+    return "\n".join(f"def function_{number}(value):  # {rng.random():.6f}" if number % 10 == 1 else
+                     f"    value = value * {rng.randint(1, 9)} + {number}" for number in range(1, lines + 1)) + "\n"
+
+def make_patch(lines: int, hunks: int) -> str:
+    parts = []
+    for index in range(hunks):
+        start = max(1, (index + 1) * lines // (hunks + 1))
+        parts.append(f"@@ -{start},3 +{start},4 @@\n     value = value + 1\n-    return value\n+    value = value - 1\n+    return value")
+    return "\n".join(parts)
+
+def make_pr_files(pr_number: int, files: int, lines: int, hunks: int) -> List[Dict[str, Any]]:
+    return [{"sha": f"{pr_number:08x}{index:032x}", "filename": f"src/module_{pr_number}_{index}.py", "status": "modified",
+             "additions": hunks * 2, "deletions": hunks, "changes": hunks * 3, "patch": make_patch(lines, hunks)}
+            for index in range(files)]
+
+def make_delivery(pr_number: int) -> Dict[str, Any]:
+    repository = {"name": REPO, "full_name": f"{OWNER}/{REPO}", "owner": {"login": OWNER}}
+    return {"event": "pull_request", "payload": {
+        "action": "opened", "number": pr_number, "repository": repository,
+        "pull_request": {"number": pr_number, "title": f"Benchmark PR {pr_number}", "body": "Synthetic change.",
+                         "changed_files": 0, "head": {"sha": f"{pr_number:040x}"},
+                         "base": {"repo": repository, "ref": "main"}}}}
+
+def make_noise_delivery(index: int) -> Dict[str, Any]:
+    return {"event": "push" if index % 2 else "issue_comment",
+            "payload": {"action": "created", "repository": {"name": REPO, "owner": {"login": OWNER}},
+                        "comment": {"body": "Looks good to me"}, "ref": "refs/heads/main"}}
+
+
+# --- Stub servers (run in a child process so they do not count towards the app's RSS) ---
+class StubState:
+    def __init__(self, args: argparse.Namespace, corpus: List[Dict[str, Any]]):
+        self.args = args
+        self.files: Dict[int, List[Dict[str, Any]]] = {}
+        self.contents: Dict[str, str] = {}
+        for delivery in corpus:
+            number = delivery["payload"].get("pull_request", {}).get("number") or delivery["payload"].get("number")
+            if number is not None and "files" in delivery:
+                self.files[int(number)] = delivery["files"]
+            self.contents.update(delivery.get("contents", {}))
+
+    def pr_files(self, pr_number: int) -> List[Dict[str, Any]]:
+        if pr_number not in self.files:
+            self.files[pr_number] = make_pr_files(pr_number, self.args.files_per_pr, self.args.file_lines, self.args.hunks)
+        return self.files[pr_number]
+
+    def content(self, path: str) -> str:
+        return self.contents.get(path) or make_file_content(path, self.args.file_lines)
+
+def make_github_handler(state: StubState) -> type:
+    class GitHubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def _send(self, status: int, body: Any, content_type: str = "application/json", headers: Optional[Dict[str, str]] = None) -> None:
+            data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("X-RateLimit-Remaining", "5000")
+            self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _read_body(self) -> Dict[str, Any]:
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self) -> None:
+            time.sleep(state.args.github_latency)
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if match := re.fullmatch(r"/repos/[^/]+/[^/]+/pulls/(\d+)/files", url.path):
+                files = state.pr_files(int(match.group(1)))
+                per_page = int(query.get("per_page", ["30"])[0])
+                page = int(query.get("page", ["1"])[0])
+                headers = {}
+                if page * per_page < len(files):
+                    headers["Link"] = f'<http://{self.headers["Host"]}{url.path}?per_page={per_page}&page={page + 1}>; rel="next"'
+                return self._send(200, files[(page - 1) * per_page:page * per_page], headers=headers)
+            if match := re.fullmatch(r"/repos/[^/]+/[^/]+/contents/(.+)", url.path):
+                content = state.content(match.group(1)).encode("utf-8")
+                if "raw" in self.headers.get("Accept", ""):
+                    return self._send(200, content, "application/vnd.github.raw")
+                return self._send(200, {"type": "file", "size": len(content), "encoding": "base64",
+                                        "content": base64.b64encode(content).decode("ascii")})
+            if match := re.fullmatch(r"/repos/[^/]+/[^/]+/pulls/(\d+)", url.path):
+                return self._send(200, make_delivery(int(match.group(1)))["payload"]["pull_request"])
+            return self._send(404, {"message": "Not Found"})
+
+        def do_POST(self) -> None:
+            time.sleep(state.args.github_latency)
+            path = urlparse(self.path).path
+            body = self._read_body()
+            if path.endswith("/comments"):
+                return self._send(201, {"id": random.randint(1, 10 ** 9), "html_url": f"http://stub{path}", "body": body.get("body")})
+            if path.endswith("/labels"):
+                return self._send(200, [{"name": label} for label in body.get("labels", [])])
+            return self._send(404, {"message": "Not Found"})
+
+        def do_PATCH(self) -> None:
+            time.sleep(state.args.github_latency)
+            return self._send(200, self._read_body())
+
+    return GitHubHandler
+
+def make_gemini_handler(state: StubState) -> type:
+    class GeminiHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+        def _send(self, body: Any) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:
+            name = urlparse(self.path).path.rsplit("/", 1)[-1]
+            self._send({"name": f"models/{name}", "inputTokenLimit": 1048576, "outputTokenLimit": 65536,
+                        "supportedGenerationMethods": ["generateContent", "countTokens"]})
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            prompt = "".join(part.get("text", "") for content in request.get("contents", []) for part in content.get("parts", []))
+            path = urlparse(self.path).path
+            if path.endswith(":countTokens"):
+                return self._send({"totalTokens": len(prompt) // 4})
+            args = state.args
+            finding = ("**[{n}] Possible off-by-one in loop bound**\n*   **Code Location**: `src/example.py:{n}`\n"
+                       "*   **Problem**: The loop reads one element past the end.\n*   **Suggestion**: Use `<` instead of `<=`.\n\n---\n")
+            findings = []
+            while sum(map(len, findings)) < args.output_tokens * 4:
+                findings.append(finding.format(n=len(findings) + 1))
+            time.sleep(args.gemini_latency)
+            if not path.endswith(":streamGenerateContent"):
+                time.sleep(args.output_tokens / max(1.0, args.tokens_per_second))
+                return self._send(self._candidate("".join(findings)))
+
+            # Streamed responses are a JSON array sent chunk by chunk, one finding per element
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for index, text in enumerate(findings):
+                time.sleep(len(text) / 4 / max(1.0, args.tokens_per_second))
+                self._write_chunk(("[" if index == 0 else ",") + json.dumps(self._candidate(text)))
+            self._write_chunk("]")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _write_chunk(self, text: str) -> None:
+            data = text.encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        @staticmethod
+        def _candidate(text: str) -> Dict[str, Any]:
+            return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"},
+                                    "finishReason": "STOP", "index": 0, "safetyRatings": []}],
+                    "promptFeedback": {"safetyRatings": []}}
+
+    return GeminiHandler
+
+def serve_stubs(args: argparse.Namespace, corpus: List[Dict[str, Any]], ports: "multiprocessing.Queue") -> None:
+    state = StubState(args, corpus)
+    github = ThreadingHTTPServer(("127.0.0.1", 0), make_github_handler(state))
+    gemini = ThreadingHTTPServer(("127.0.0.1", 0), make_gemini_handler(state))
+    github.daemon_threads = gemini.daemon_threads = True
+    threading.Thread(target=gemini.serve_forever, daemon=True).start()
+    ports.put((github.server_port, gemini.server_port))
+    github.serve_forever()
+
+
+# --- Benchmark ---
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def load_corpus(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    if args.corpus:
+        with open(args.corpus, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    corpus = []
+    noise_every = int(1 / args.noise_ratio) if args.noise_ratio > 0 else 0
+    for index in range(args.deliveries):
+        if noise_every and index % noise_every == noise_every - 1:
+            corpus.append(make_noise_delivery(index))
+        else:
+            corpus.append(make_delivery(1000 + index))
+    return corpus
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    corpus = load_corpus(args)
+    ports: "multiprocessing.Queue" = multiprocessing.Queue()
+    stubs = multiprocessing.Process(target=serve_stubs, args=(args, corpus, ports), daemon=True)
+    stubs.start()
+    github_port, gemini_port = ports.get(timeout=30)
+
+    os.environ.setdefault("GITHUB_TOKEN", "benchmark-token")
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark-key")
+    os.environ["GITHUB_API_URL"] = f"http://127.0.0.1:{github_port}"
+    os.environ["GEMINI_API_ENDPOINT"] = f"http://127.0.0.1:{gemini_port}"
+    os.environ["GEMINI_TRANSPORT"] = "rest"
+    os.environ.setdefault("REVIEW_DEBOUNCE_SECONDS", "0")
+    os.environ.setdefault("REVIEW_QUEUE_SIZE", str(len(corpus) + 1))
+    os.environ.setdefault("GITHUB_REQUESTS_PER_SECOND", "1000")
+    os.environ.setdefault("GITHUB_REQUEST_BURST", "1000")
+    os.environ.setdefault("CONTEXT_PROVIDER", "rest")
+
+    import logging
+    import app as reviewer
+    from werkzeug.serving import make_server
+    for name in ("", "werkzeug"):
+        logging.getLogger(name).setLevel(args.log_level)
+
+    # Keep raw stage samples alongside the app's histograms for exact percentiles
+    stage_samples: Dict[str, List[float]] = {}
+    samples_lock = threading.Lock()
+    observe = reviewer.metrics.observe
+
+    def record(name: str, value: float, **labels: str) -> None:
+        observe(name, value, **labels)
+        if name == reviewer.STAGE_METRIC:
+            with samples_lock:
+                stage_samples.setdefault(labels.get("stage", "unknown"), []).append(value)
+
+    reviewer.metrics.observe = record
+
+    server = make_server("127.0.0.1", 0, reviewer.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    webhook_url = f"http://127.0.0.1:{server.server_port}/webhook"
+
+    import requests
+    session = requests.Session()
+    job_ids: List[str] = []
+    webhook_latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    lock = threading.Lock()
+
+    def deliver(delivery: Dict[str, Any]) -> None:
+        start = time.perf_counter()
+        response = session.post(webhook_url, data=json.dumps(delivery["payload"]),
+                                headers={"Content-Type": "application/json", "X-GitHub-Event": delivery["event"],
+                                         "X-GitHub-Delivery": f"bench-{random.getrandbits(64):x}"})
+        elapsed = time.perf_counter() - start
+        with lock:
+            webhook_latencies.append(elapsed)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code == 202:
+                job_ids.append(response.json()["job_id"])
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.senders) as senders:
+        for index, delivery in enumerate(corpus):
+            delay = started + index / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            senders.submit(deliver, delivery)
+    replay_seconds = time.perf_counter() - started
+
+    deadline = time.monotonic() + args.timeout
+    jobs: List[Dict[str, Any]] = []
+    while time.monotonic() < deadline:
+        jobs = [reviewer.review_queue.get_job(job_id) or {} for job_id in job_ids]
+        if all(job.get("status") in reviewer.ReviewJobQueue.FINISHED_STATUSES for job in jobs):
+            break
+        time.sleep(0.05)
+    total_seconds = time.perf_counter() - started
+    server.shutdown()
+    stubs.terminate()
+
+    finished = [job for job in jobs if job.get("status") in reviewer.ReviewJobQueue.FINISHED_STATUSES]
+    review_latencies = [job["finished_at"] - job["enqueued_at"] for job in finished]
+    results: Dict[str, int] = {}
+    for job in finished:
+        status = (job.get("result") or {}).get("status", job.get("status"))
+        results[status] = results.get(status, 0) + 1
+
+    stages = {"webhook_request": webhook_latencies, "review_end_to_end": review_latencies, **stage_samples}
+    return {
+        "deliveries": len(corpus),
+        "webhook_statuses": statuses,
+        "reviews_queued": len(job_ids),
+        "reviews_finished": len(finished),
+        "review_results": results,
+        "replay_seconds": round(replay_seconds, 3),
+        "total_seconds": round(total_seconds, 3),
+        "reviews_per_second": round(len(finished) / total_seconds, 3) if total_seconds else 0.0,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "stages": {name: {"count": len(values), "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+                          "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+                          "p99_ms": round(percentile(values, 0.99) * 1000, 2)}
+                   for name, values in stages.items()},
+    }
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"Deliveries: {report['deliveries']}  webhook statuses: {report['webhook_statuses']}")
+    print(f"Reviews: {report['reviews_finished']}/{report['reviews_queued']} finished {report['review_results']}")
+    print(f"Replay: {report['replay_seconds']}s  total: {report['total_seconds']}s  "
+          f"throughput: {report['reviews_per_second']} reviews/s  peak RSS: {report['peak_rss_mb']} MB")
+    print(f"\n{'stage':<24}{'count':>8}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}")
+    for name, stats in report["stages"].items():
+        print(f"{name:<24}{stats['count']:>8}{stats['p50_ms']:>12}{stats['p95_ms']:>12}{stats['p99_ms']:>12}")
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline benchmark of the PR reviewer against stub GitHub and Gemini servers")
+    parser.add_argument("--corpus", help="JSON Lines file of recorded webhook deliveries (default: synthetic)")
+    parser.add_argument("--deliveries", type=int, default=100, help="Number of synthetic deliveries")
+    parser.add_argument("--noise-ratio", type=float, default=0.5, help="Fraction of synthetic deliveries that are irrelevant events")
+    parser.add_argument("--rate", type=float, default=20.0, help="Target delivery rate (per second)")
+    parser.add_argument("--senders", type=int, default=16, help="Concurrent webhook senders")
+    parser.add_argument("--files-per-pr", type=int, default=20)
+    parser.add_argument("--file-lines", type=int, default=600)
+    parser.add_argument("--hunks", type=int, default=3, help="Changed hunks per file")
+    parser.add_argument("--github-latency", type=float, default=0.02, help="Stub GitHub latency per request (seconds)")
+    parser.add_argument("--gemini-latency", type=float, default=0.5, help="Stub Gemini time to first token (seconds)")
+    parser.add_argument("--output-tokens", type=int, default=800, help="Tokens per stub Gemini response")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="Stub Gemini output throughput")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Maximum time to wait for reviews to finish (seconds)")
+    parser.add_argument("--log-level", default="WARNING", help="Log level of the app while benchmarking")
+    parser.add_argument("--json", help="Also write the report to this file")
+    return parser.parse_args(argv)
+
+def main() -> None:
+    args = parse_args()
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
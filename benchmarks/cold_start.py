@@ -0,0 +1,65 @@
+"""
+Cold-start benchmark for the PR reviewer.
+
+Starts fresh interpreters and measures how long importing the app takes and how long until the first request
+(GET /health) is answered, which is what gunicorn boot, autoscaling and serverless cold starts pay. Exits with
+status 1 when the median time to the first response exceeds the target.
+
+Usage:
+    python benchmarks/cold_start.py --runs 10 --target-ms 500
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get("/health")
+answered = time.perf_counter()
+print(json.dumps({"import_seconds": imported - start, "first_response_seconds": answered - start,
+                  "status": response.status_code, "gemini_sdk_loaded": "google.generativeai" in sys.modules,
+                  "httpx_loaded": "httpx" in sys.modules}))
+"""
+
+def measure(runs: int) -> List[Dict[str, Any]]:
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.setdefault("GITHUB_TOKEN", "benchmark-token")
+    env.setdefault("GEMINI_API_KEY", "benchmark-key")
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", PROBE], env=env, capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return samples
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure the cold-start time of the PR reviewer")
+    parser.add_argument("--runs", type=int, default=10, help="Number of fresh interpreters to start")
+    parser.add_argument("--target-ms", type=float, default=500.0, help="Target median time to the first response (ms)")
+    return parser.parse_args(argv)
+
+def main() -> None:
+    args = parse_args()
+    samples = measure(args.runs)
+    import_ms = statistics.median(sample["import_seconds"] for sample in samples) * 1000
+    first_response_ms = statistics.median(sample["first_response_seconds"] for sample in samples) * 1000
+    print(f"Runs: {len(samples)}  median import: {import_ms:.1f} ms  median first response: {first_response_ms:.1f} ms  "
+          f"(target {args.target_ms:.0f} ms)")
+    if any(sample["gemini_sdk_loaded"] for sample in samples):
+        print("Warning: the Gemini SDK was imported during startup.")
+    if any(sample["httpx_loaded"] for sample in samples):
+        print("Warning: httpx was imported during startup.")
+    if first_response_ms > args.target_ms:
+        print("Cold start is slower than the target.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()